@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+
+# Offline stand-in for the AES results service, for load testing and benchmarking without
+# hitting AES. Serves every endpoint vb_results uses, from recorded fixtures when there is one
+# for the url and otherwise from a synthesized tournament. Latency, jitter and errors can be injected.
+#
+# Point vb_results at it with:
+#   VB_AES_BASE_URL=http://127.0.0.1:8800 VB_AES_LANDING_URL=http://127.0.0.1:8800
+#
+# Record real responses as fixtures (later runs replay them):
+#   python3 aes_standin.py --record --fixtures fixtures/2023-presidents-day
+
+from flask import Flask, Response, request
+
+import requests
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import random
+import re
+import time
+import zlib
+
+
+results_upstream = "https://results.advancedeventsystems.com"
+landing_upstream = "https://advancedeventsystems.com"
+
+
+# A deterministic synthetic tournament. Every event id gets its own event with the given number
+# of divisions and teams; teams are spread across clubs and grouped into pools of four, each pool
+# on its own court playing a six match round robin with the idle team working.
+class SyntheticAES:
+    POOL_SIZE = 4
+    # Round robin order for a pool of four: (first, second, work) team positions
+    POOL_ROUNDS = [(0, 2, 1), (1, 3, 0), (0, 1, 2), (2, 3, 1), (1, 2, 3), (0, 3, 2)]
+
+    def __init__(self, divisions=4, teams_per_division=24, clubs=12, events=40, played_fraction=0.5):
+        self.divisions = divisions
+        self.teams_per_division = teams_per_division
+        self.clubs = clubs
+        self.events = events
+        self.played_fraction = played_fraction
+        self.start = datetime.datetime.combine(datetime.date.today(), datetime.time(8, 0))
+
+    def division_ids(self):
+        return [1000 + d for d in range(self.divisions)]
+
+    def division_info(self, division_id):
+        age = 11 + (division_id - 1000) % 8
+        return {"DivisionId": division_id, "Name": f"{age} Open", "TeamCount": self.teams_per_division,
+                "CodeAlias": f"{age}O", "ColorHex": "#FF7F5F"}
+
+    def team_ids(self, division_id):
+        return [division_id * 100 + t for t in range(self.teams_per_division)]
+
+    def club_info(self, club_id):
+        return {"ClubId": club_id, "Name": f"Club {club_id}"}
+
+    def team_club_id(self, team_id):
+        return 400 + team_id % self.clubs
+
+    def team_name(self, team_id):
+        division_id = team_id // 100
+        return f"Club {self.team_club_id(team_id)} {self.division_info(division_id)['CodeAlias']} {team_id % 100}"
+
+    def team_info(self, team_id):
+        return {
+            "TeamId": team_id,
+            "TeamName": self.team_name(team_id),
+            "TeamCode": f"g{team_id}",
+            "TeamText": f"{self.team_name(team_id)} (SY)",
+            "SearchableTeamName": self.team_name(team_id).lower(),
+            "TeamClub": self.club_info(self.team_club_id(team_id)),
+            "TeamDivision": self.division_info(team_id // 100),
+            "OpponentTeamId": None,
+            "OpponentTeamName": None,
+            "NextPendingReseed": False,
+        }
+
+    # Play ids are negative in AES; one pool per four teams in a division
+    def pool_ids(self, division_id):
+        pools = (self.teams_per_division + SyntheticAES.POOL_SIZE - 1) // SyntheticAES.POOL_SIZE
+        return [-(division_id * 100 + p + 1) for p in range(pools)]
+
+    def pool_of_team(self, team_id):
+        division_id = team_id // 100
+        return -(division_id * 100 + (team_id % 100) // SyntheticAES.POOL_SIZE + 1)
+
+    def pool_teams(self, play_id):
+        division_id, pool = divmod(-play_id - 1, 100)
+        first = division_id * 100 + pool * SyntheticAES.POOL_SIZE
+        return [team_id for team_id in range(first, first + SyntheticAES.POOL_SIZE)
+                if team_id % 100 < self.teams_per_division]
+
+    def court(self, play_id):
+        division_id, pool = divmod(-play_id - 1, 100)
+        number = (division_id - 1000) * 10 + pool + 1
+        return {"CourtId": -60000 - number, "Name": f"Court {number}", "VideoLink": ""}
+
+    def play_info(self, play_id):
+        pool = (-play_id - 1) % 100 + 1
+        return {"Type": 0, "PlayId": play_id, "FullName": f"Pool {pool}", "ShortName": f"P{pool}",
+                "CompleteShortName": f"R1 P{pool}", "CompleteFullName": f"Round 1 Pool {pool}",
+                "Order": 0, "Courts": [self.court(play_id)]}
+
+    def pool_matches(self, play_id):
+        teams = self.pool_teams(play_id)
+        played = int(len(SyntheticAES.POOL_ROUNDS) * self.played_fraction)
+        matches = []
+        for number, (first, second, work) in enumerate(SyntheticAES.POOL_ROUNDS):
+            if max(first, second, work) >= len(teams):
+                continue
+            start = self.start + datetime.timedelta(hours=number)
+            has_scores = number < played
+            first_won = (teams[first] + number) % 2 == 0
+            sets = [{"FirstTeamScore": (25 if first_won else 18) if has_scores else None,
+                     "SecondTeamScore": (18 if first_won else 25) if has_scores else None,
+                     "ScoreText": "", "IsDecidingSet": set_number == 2}
+                    for set_number in range(2 if has_scores else 3)]
+            matches.append({
+                "FirstTeamId": teams[first],
+                "FirstTeamName": self.team_name(teams[first]),
+                "FirstTeamWon": has_scores and first_won,
+                "FirstTeamText": self.team_name(teams[first]),
+                "SecondTeamId": teams[second],
+                "SecondTeamName": self.team_name(teams[second]),
+                "SecondTeamWon": has_scores and not first_won,
+                "SecondTeamText": self.team_name(teams[second]),
+                "MatchFullName": f"Match {number + 1}",
+                "MatchShortName": f"M{number + 1}",
+                "HasScores": has_scores,
+                "Sets": sets,
+                "WorkTeamId": teams[work],
+                "WorkTeamText": self.team_name(teams[work]),
+                "TypeOfOutcome": 0,
+                "MatchId": play_id * 10 - number,
+                "Court": self.court(play_id),
+                "ScheduledStartDateTime": start.strftime("%Y-%m-%dT%H:%M:%S"),
+                "ScheduledEndDateTime": (start + datetime.timedelta(minutes=59, seconds=59)).strftime("%Y-%m-%dT%H:%M:%S"),
+            })
+        return matches
+
+    def event(self, event_id):
+        return {
+            "Key": event_id,
+            "EventId": zlib.crc32(event_id.encode()) % 100000,
+            "Name": f"Synthetic Classic {event_id}",
+            "StartDate": self.start.strftime("%Y-%m-%dT00:00:00"),
+            "EndDate": (self.start + datetime.timedelta(days=2)).strftime("%Y-%m-%dT23:59:59.9999999"),
+            "Location": "Stand-in Convention Center",
+            "CustomEventType": None,
+            "IsOver": False,
+            "Clubs": [self.club_info(400 + c) for c in range(self.clubs)],
+            "Divisions": [dict(self.division_info(d), IsFinished=False) for d in self.division_ids()],
+        }
+
+    def poolsheet(self, event_id, play_id):
+        pool = dict(self.play_info(play_id), Teams=[self.team_info(t) for t in self.pool_teams(play_id)])
+        return {"Pool": pool, "Matches": self.pool_matches(play_id), "FutureRoundMatches": []}
+
+    def team_matches(self, team_id):
+        play_id = self.pool_of_team(team_id)
+        return play_id, [match for match in self.pool_matches(play_id)
+                         if team_id in (match["FirstTeamId"], match["SecondTeamId"], match["WorkTeamId"])]
+
+    def schedule(self, event_id, division_id, team_id, when):
+        play_id, matches = self.team_matches(team_id)
+        if when == 'past':
+            return [{"Match": match, "Play": self.play_info(play_id)} for match in matches
+                    if match["HasScores"] and team_id != match["WorkTeamId"]]
+        if when == 'current':
+            return [{"Play": self.play_info(play_id), "PlayType": 0, "Matches": matches}]
+        future = []
+        for rank in range(1, SyntheticAES.POOL_SIZE + 1):
+            start = self.start + datetime.timedelta(days=1, hours=rank - 1)
+            court = {"CourtId": -61000 - rank, "Name": f"Court {20 + rank}", "VideoLink": ""}
+            future.append({
+                "PotentialRank": rank,
+                "PotentialRankText": f"{rank}{['st', 'nd', 'rd', 'th'][rank - 1]}-R1 P{(-play_id - 1) % 100 + 1} ",
+                "NextMatch": {"MatchId": play_id * 100 - rank, "Court": court,
+                              "ScheduledStartDateTime": start.strftime("%Y-%m-%dT%H:%M:%S")},
+                "WorkMatch": None,
+                "NextPlay": {"Type": 1, "PlayId": play_id * 100 - rank, "FullName": f"Bracket {rank}",
+                             "CompleteFullName": f"Round 2 Bracket {rank}", "Courts": [court]},
+                "PlayType": 1,
+                "NextPendingReseed": False,
+            })
+        return future
+
+    def next_assignments(self, event_id, division_id, club_id):
+        teams = []
+        for division in self.division_ids():
+            if division_id is not None and division != division_id:
+                continue
+            for team_id in self.team_ids(division):
+                if club_id is None or self.team_club_id(team_id) == club_id:
+                    teams.append(dict(self.team_info(team_id), NextMatch=None, WorkMatchs=[], OpponentClub=None))
+        teams.sort(key=lambda team: (team["TeamName"], team["TeamCode"]))
+        return {"@odata.context": f"/odata/{event_id}/$metadata#NextAssignmentViewModel", "value": teams}
+
+    def landing_events(self):
+        events = []
+        for number in range(self.events):
+            start = self.start + datetime.timedelta(days=number - 5)
+            events.append({"eventSchedulerKey": f"SYNTH{number:04d}", "name": f"Synthetic Classic {number}",
+                           "startDate": start.strftime("%Y-%m-%dT00:00:00Z"),
+                           "endDate": (start + datetime.timedelta(days=2)).strftime("%Y-%m-%dT00:00:00Z")})
+        return {"@odata.count": len(events), "value": events}
+
+    # Returns the json payload for an AES path, or None if the path isn't one vb_results uses
+    def response(self, path):
+        routes = [
+            (r'/api/event/([^/]+)', lambda e: self.event(e)),
+            (r'/api/event/([^/]+)/teams/(\d+)', lambda e, t: self.team_info(int(t))),
+            (r'/api/event/([^/]+)/division/(\d+)/team/(\d+)/schedule/(past|current|future)',
+             lambda e, d, t, when: self.schedule(e, int(d), int(t), when)),
+            (r'/api/event/([^/]+)/poolsheet/(-?\d+)', lambda e, p: self.poolsheet(e, int(p))),
+            (r'/odata/([^/]+)/nextassignments\(dId=(\w+),cId=(\w+),tIds=\[[^\]]*\]\)',
+             lambda e, d, c: self.next_assignments(e, None if d == 'null' else int(d), None if c == 'null' else int(c))),
+            (r'/api/landing/events', lambda: self.landing_events()),
+        ]
+        for pattern, handler in routes:
+            match = re.fullmatch(pattern, path)
+            if match:
+                return handler(*match.groups())
+        return None
+
+
+# Recorded responses, one json file per url: { "url", "status", "content_type", "body" }
+class Fixtures:
+    def __init__(self, directory):
+        self.directory = directory
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def path(self, url):
+        name = re.sub(r'[^A-Za-z0-9-]+', '_', url.split('?', 1)[0]).strip('_')[-80:]
+        return os.path.join(self.directory, f"{name}__{hashlib.sha1(url.encode()).hexdigest()[:10]}.json")
+
+    def load(self, url):
+        if not self.directory:
+            return None
+        try:
+            with open(self.path(url)) as fixture:
+                return json.load(fixture)
+        except FileNotFoundError:
+            return None
+
+    def save(self, url, status, content_type, body):
+        with open(self.path(url), 'w') as fixture:
+            json.dump({'url': url, 'status': status, 'content_type': content_type, 'body': body}, fixture)
+
+
+def create_standin_app(options):
+    app = Flask(__name__)
+    synthetic = SyntheticAES(options.divisions, options.teams, options.clubs, options.events, options.played)
+    fixtures = Fixtures(options.fixtures)
+    rng = random.Random(options.seed)
+
+    def upstream_url(path, query):
+        upstream = landing_upstream if path.startswith('/api/landing/') else results_upstream
+        return f"{upstream}{path}{'?' + query if query else ''}"
+
+    @app.route('/<path:path>')
+    def serve(path):
+        path = f"/{path}"
+        query = request.query_string.decode()
+        url = f"{path}{'?' + query if query else ''}"
+
+        delay = options.latency + rng.uniform(-options.jitter, options.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        if rng.random() < options.error_rate:
+            return Response('{"Message":"Injected error"}', status=503, mimetype='application/json')
+
+        fixture = fixtures.load(url)
+        if fixture is None and options.record:
+            upstream = requests.get(upstream_url(path, query), timeout=30)
+            fixtures.save(url, upstream.status_code, upstream.headers.get('Content-Type', 'application/json'), upstream.text)
+            fixture = fixtures.load(url)
+        if fixture is not None:
+            return Response(fixture['body'], status=fixture['status'], mimetype=fixture['content_type'].split(';')[0])
+
+        payload = synthetic.response(path) if options.synthesize else None
+        if payload is None:
+            return Response('{"Message":"Not found"}', status=404, mimetype='application/json')
+        return Response(json.dumps(payload), mimetype='application/json')
+
+    return app
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline stand-in for the AES results service")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8800)
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Latency varies by up to +/- this many seconds")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of requests answered with a 503")
+    parser.add_argument('--seed', type=int, default=None, help="Seed for latency and error injection")
+    parser.add_argument('--fixtures', help="Directory of recorded fixtures to replay (and to record into)")
+    parser.add_argument('--record', action='store_true', help="Fetch and save a fixture for urls that don't have one")
+    parser.add_argument('--no-synthesize', dest='synthesize', action='store_false',
+                        help="Answer 404 instead of synthesizing urls without a fixture")
+    parser.add_argument('--divisions', type=int, default=4)
+    parser.add_argument('--teams', type=int, default=24, help="Teams per division")
+    parser.add_argument('--clubs', type=int, default=12)
+    parser.add_argument('--events', type=int, default=40, help="Events in the landing event list")
+    parser.add_argument('--played', type=float, default=0.5, help="Fraction of pool matches that have scores")
+    options = parser.parse_args(argv)
+    if options.record and not options.fixtures:
+        parser.error("--record needs --fixtures")
+    return options
+
+
+if __name__ == '__main__':
+    options = parse_args()
+    create_standin_app(options).run(host=options.host, port=options.port, threaded=True)
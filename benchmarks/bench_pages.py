@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+
+# Page render benchmark. Drives the app's routes at a given concurrency with canned AES payloads
+# (the synthetic tournament from aes_standin.py) substituted for upstream calls, so it needs no
+# network. Reports requests/sec, p50/p95/p99 latency, upstream calls per request and peak memory
+# per route, and writes them to a json file that can be compared with a previous run.
+#
+# Usage:
+#   python3 benchmarks/bench_pages.py --requests 500 --concurrency 8 --output bench_results.json
+#   python3 benchmarks/bench_pages.py --compare bench_results.json
+#
+# By default the payloads replace json_request, measuring page building and rendering alone.
+# --through-cache replaces the HTTP session instead, so response parsing and the cache layers are
+# included.
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+repo_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, repo_dir)
+import aes_standin
+import vb_results
+
+
+class CannedAES:
+    def __init__(self, synthetic):
+        self.synthetic = synthetic
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.bodies = {}
+
+    def payload(self, url):
+        with self.lock:
+            self.calls += 1
+        path = url.split('?', 1)[0]
+        for prefix in (vb_results.base_url, vb_results.landing_url):
+            if path.startswith(prefix):
+                path = path[len(prefix):]
+                break
+        payload = self.synthetic.response(path)
+        return {} if payload is None else payload
+
+    def json_request(self, url):
+        return self.payload(url)
+
+    def fetch_json(self, url, previous=None):
+        return vb_results.CacheEntry(self.payload(url), time.time())
+
+    # Stands in for the HTTP session, answering with the payload serialized as AES would send it,
+    # so the response parsing is included. Each url's body is only serialized once, so the
+    # serializing isn't timed along with the parsing.
+    def get(self, url, headers=None, timeout=None):
+        body = self.bodies.get(url)
+        if body is None:
+            body = self.bodies[url] = json.dumps(self.payload(url)).encode()
+        else:
+            with self.lock:
+                self.calls += 1
+        response = requests.Response()
+        response.status_code = 200
+        response.url = url
+        response.headers['Content-Type'] = 'application/json; charset=utf-8'
+        response._content = body
+        return response
+
+
+# Paths for each benchmarked route, spread across the synthetic event's divisions, clubs and teams
+def route_paths(synthetic, event_id, rng, count):
+    teams = [(division_id, team_id) for division_id in synthetic.division_ids() for team_id in synthetic.team_ids(division_id)]
+    clubs = [400 + club for club in range(synthetic.clubs)]
+
+    def team_paths(fmt):
+        return [f"/event/{event_id}/{division_id}/{team_id}?fmt={fmt}" for division_id, team_id in rng.choices(teams, k=count)]
+
+    return {
+        'team_page_rich': team_paths('rich'),
+        'team_page_plain': team_paths('plain'),
+        'event_clubs': [f"/event/{event_id}"] * count,
+        'event_club_teams': [f"/event/{event_id}/{club_id}" for club_id in rng.choices(clubs, k=count)],
+        'event_list': ["/events"] * count,
+        'club_dashboard': [f"/event/{event_id}/club/{club_id}/dashboard" for club_id in rng.choices(clubs, k=count)],
+        'division_schedule': [f"/event/{event_id}/division/{division_id}"
+                              for division_id in rng.choices(synthetic.division_ids(), k=count)],
+    }
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_route(app, canned, paths, concurrency):
+    local = threading.local()
+
+    def timed_get(path):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = app.test_client()
+        start = time.perf_counter()
+        response = client.get(path)
+        response.get_data()  # consume streamed pages
+        elapsed = time.perf_counter() - start
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} returned {response.status_code}")
+        return elapsed
+
+    calls_before = canned.calls
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = sorted(executor.map(timed_get, paths))
+    wall = time.perf_counter() - start
+
+    return {
+        'requests': len(paths),
+        'requests_per_sec': len(paths) / wall,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'upstream_calls_per_request': (canned.calls - calls_before) / len(paths),
+    }
+
+
+# Peak traced allocation while serving a few requests, measured separately from the timed runs
+def peak_memory(app, paths):
+    client = app.test_client()
+    tracemalloc.start()
+    try:
+        for path in paths:
+            client.get(path).get_data()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=repo_dir, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results, baseline=None):
+    print(f"{'route':<18} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'calls/req':>9} {'peak KiB':>9}")
+    for route, result in results['routes'].items():
+        line = (f"{route:<18} {result['requests_per_sec']:9.1f} {result['p50_ms']:8.2f} {result['p95_ms']:8.2f} "
+                f"{result['p99_ms']:8.2f} {result['upstream_calls_per_request']:9.2f} {result['peak_memory_bytes'] / 1024:9.0f}")
+        previous = (baseline or {}).get('routes', {}).get(route)
+        if previous:
+            change = result['requests_per_sec'] / previous['requests_per_sec'] - 1
+            line += f"  ({change:+.0%} req/s vs {baseline.get('commit') or 'baseline'})"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark page render throughput and latency")
+    parser.add_argument('--requests', type=int, default=200, help="Requests per route")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--routes', nargs='*', help="Only these routes")
+    parser.add_argument('--divisions', type=int, default=4)
+    parser.add_argument('--teams', type=int, default=24, help="Teams per division")
+    parser.add_argument('--events', type=int, default=40, help="Events in the landing event list")
+    parser.add_argument('--through-cache', action='store_true', help="Substitute the HTTP session instead of json_request")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--compare', help="Results file from a previous run to compare against")
+    args = parser.parse_args()
+
+    synthetic = aes_standin.SyntheticAES(divisions=args.divisions, teams_per_division=args.teams, events=args.events)
+    canned = CannedAES(synthetic)
+    state_dir = tempfile.mkdtemp(prefix='vb_bench_')
+    app = vb_results.create_app({
+        'profile': 'production',
+        'cache_db_path': os.path.join(state_dir, 'cache.sqlite3'),
+        'poller_enabled': False,
+        'warmup_enabled': False,
+        'prefetch_enabled': False,
+        # The canned upstream answers instantly; don't let the per-host rate limit throttle it
+        'upstream_rate_limit': 10**6,
+        'upstream_rate_burst': 10**6,
+    })
+    vb_results.suppress_logging = True
+    if args.through_cache:
+        vb_results.http_session = canned
+    else:
+        vb_results.json_request = canned.json_request
+
+    paths = route_paths(synthetic, 'BENCH1', random.Random(args.seed), args.requests)
+    if args.routes:
+        paths = {route: route_paths for route, route_paths in paths.items() if route in args.routes}
+
+    results = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'config': vars(args),
+        'routes': {},
+    }
+    for route, route_paths_list in paths.items():
+        # Warm up imports, template compilation and (with --through-cache) the cache
+        run_route(app, canned, route_paths_list[:args.concurrency], args.concurrency)
+        result = run_route(app, canned, route_paths_list, args.concurrency)
+        result['peak_memory_bytes'] = peak_memory(app, route_paths_list[:5])
+        results['routes'][route] = result
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as previous:
+            baseline = json.load(previous)
+    print_results(results, baseline)
+
+    with open(args.output, 'w') as output:
+        json.dump(results, output, indent=2)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+# Parse cost of large AES payloads: for each endpoint family, the time fetch_json takes to turn a
+# canned response body into the cached value, the memory that value retains, and the peak memory
+# of rendering pages from a cold cache. Payloads come from the synthetic tournament.
+#
+# Usage:
+#   python3 benchmarks/bench_parse.py --teams 96 --events 1000 --repeat 50
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import aes_standin
+import vb_results
+from bench_pages import CannedAES
+
+
+def family_urls(synthetic, event_id):
+    division_id = synthetic.division_ids()[0]
+    team_id = synthetic.team_ids(division_id)[0]
+    base = vb_results.base_url
+    return {
+        'events_list': f"{vb_results.landing_url}/api/landing/events?$count=true",
+        'event': f"{base}/api/event/{event_id}",
+        'assignments': f"{base}/odata/{event_id}/nextassignments(dId=null,cId=null,tIds=[])",
+        'poolsheet': f"{base}/api/event/{event_id}/poolsheet/{synthetic.pool_of_team(team_id)}",
+        'schedule_past': f"{base}/api/event/{event_id}/division/{division_id}/team/{team_id}/schedule/past",
+        'schedule_future': f"{base}/api/event/{event_id}/division/{division_id}/team/{team_id}/schedule/future",
+    }
+
+
+# Median seconds per fetch_json call and bytes retained by the resulting values
+def parse_cost(url, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        vb_results.fetch_json(url)
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    values = [vb_results.fetch_json(url).value for _ in range(10)]
+    retained = tracemalloc.get_traced_memory()[0] / len(values)
+    tracemalloc.stop()
+    return statistics.median(times), retained
+
+
+# Peak traced memory while serving the path with nothing cached
+def cold_peak(client, path):
+    vb_results.response_cache.entries.clear()
+    if vb_results.disk_cache is not None:
+        vb_results.disk_cache.purge(None, None, None)
+    tracemalloc.start()
+    client.get(path).get_data()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark parsing large AES payloads")
+    parser.add_argument('--teams', type=int, default=96, help="Teams per division")
+    parser.add_argument('--events', type=int, default=1000, help="Events in the landing event list")
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    synthetic = aes_standin.SyntheticAES(divisions=4, teams_per_division=args.teams, events=args.events)
+    canned = CannedAES(synthetic)
+    app = vb_results.create_app({
+        'profile': 'production',
+        'cache_db_path': os.path.join(tempfile.mkdtemp(prefix='vb_bench_'), 'cache.sqlite3'),
+        'poller_enabled': False,
+        'warmup_enabled': False,
+        'prefetch_enabled': False,
+        # The canned upstream answers instantly; don't let the per-host rate limit throttle it
+        'upstream_rate_limit': 10**6,
+        'upstream_rate_burst': 10**6,
+    })
+    vb_results.suppress_logging = True
+    vb_results.http_session = canned
+
+    print(f"{'family':<16} {'parse ms':>9} {'retained KiB':>13}")
+    for family, url in family_urls(synthetic, 'BENCH1').items():
+        seconds, retained = parse_cost(url, args.repeat)
+        print(f"{family:<16} {seconds * 1000:9.3f} {retained / 1024:13.1f}")
+
+    client = app.test_client()
+    division_id = synthetic.division_ids()[0]
+    team_id = synthetic.team_ids(division_id)[0]
+    print(f"{'page':<16} {'cold peak KiB':>13}")
+    for label, path in (('team_page', f"/event/BENCH1/{division_id}/{team_id}"),
+                        ('division', f"/event/BENCH1/division/{division_id}"),
+                        ('event_list', "/events")):
+        print(f"{label:<16} {cold_peak(client, path) / 1024:13.1f}")
+
+
+if __name__ == '__main__':
+    main()
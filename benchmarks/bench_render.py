@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+# Rendering throughput for large pages: a division view with many teams (one table row per match)
+# and a long event list. Payloads come from the synthetic tournament and are served from the
+# response cache after the first request, so the timing is dominated by building and rendering
+# the rows. Reports rows rendered per second for each page.
+#
+# Usage:
+#   python3 benchmarks/bench_render.py --teams 96 --events 2000 --renders 50
+
+import argparse
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import aes_standin
+import vb_results
+from bench_pages import CannedAES
+
+
+# Rows on the page and rows per second, from the median render time (the machine may be noisy)
+def rows_per_second(client, path, renders):
+    html = client.get(path).get_data(as_text=True)
+    rows = len(re.findall(r'<tr[ >]', html))
+    times = []
+    for _ in range(renders):
+        start = time.perf_counter()
+        client.get(path).get_data()
+        times.append(time.perf_counter() - start)
+    return rows, rows / statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark rows rendered per second on large pages")
+    parser.add_argument('--teams', type=int, default=96, help="Teams in the benchmarked division")
+    parser.add_argument('--events', type=int, default=2000, help="Events in the landing event list")
+    parser.add_argument('--renders', type=int, default=50)
+    args = parser.parse_args()
+
+    synthetic = aes_standin.SyntheticAES(divisions=1, teams_per_division=args.teams, events=args.events)
+    canned = CannedAES(synthetic)
+    app = vb_results.create_app({
+        'profile': 'production',
+        'cache_db_path': os.path.join(tempfile.mkdtemp(prefix='vb_bench_'), 'cache.sqlite3'),
+        'poller_enabled': False,
+        'warmup_enabled': False,
+        'prefetch_enabled': False,
+    })
+    vb_results.suppress_logging = True
+    vb_results.fetch_json = canned.fetch_json
+    client = app.test_client()
+
+    division_id = synthetic.division_ids()[0]
+    for label, path in (('division', f"/event/BENCH1/division/{division_id}"), ('event_list', "/events")):
+        rows, rate = rows_per_second(client, path, args.renders)
+        print(f"{label:<12} {rows:6d} rows/page {rate:12.0f} rows/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+# Counts the new upstream connections (TCP+TLS handshakes) made while rendering a team page,
+# comparing bare requests.get calls against the shared pooled session. The caches are emptied
+# before each render, so every render makes its upstream calls.
+#
+# Usage:
+#   python benchmarks/handshakes.py <event_id> <division_id> <team_id> [--renders 5]
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import requests
+from urllib3.connectionpool import HTTPConnectionPool
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import vb_results
+
+
+new_connections = 0
+original_new_conn = HTTPConnectionPool._new_conn
+
+def counting_new_conn(self):
+    global new_connections
+    new_connections += 1
+    return original_new_conn(self)
+
+HTTPConnectionPool._new_conn = counting_new_conn
+
+
+# Empties the response caches, so every render goes upstream and its handshakes are counted
+def clear_caches():
+    vb_results.response_cache.entries.clear()
+    if vb_results.disk_cache is not None:
+        vb_results.disk_cache.purge()
+
+
+# Stands in for the shared session, opening a fresh connection for every call like the old code did
+class BareRequests:
+    def get(self, url, **kwargs):
+        return requests.get(url, **kwargs)
+
+
+def run(app, label, session, page_url, renders):
+    global new_connections
+    vb_results.http_session = session
+    client = app.test_client()
+    new_connections = 0
+    start = time.perf_counter()
+    for _ in range(renders):
+        clear_caches()
+        client.get(page_url)
+    elapsed = time.perf_counter() - start
+    print(f"{label:>8}: {new_connections / renders:6.1f} handshakes/render, {elapsed / renders:6.3f}s/render")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Count upstream handshakes per team page render")
+    parser.add_argument('event_id')
+    parser.add_argument('division_id')
+    parser.add_argument('team_id')
+    parser.add_argument('--renders', type=int, default=5)
+    args = parser.parse_args()
+
+    app = vb_results.create_app({
+        'profile': 'production',
+        'cache_db_path': os.path.join(tempfile.mkdtemp(prefix='vb_bench_'), 'cache.sqlite3'),
+        'poller_enabled': False,
+        'warmup_enabled': False,
+        'prefetch_enabled': False,
+    })
+    vb_results.suppress_logging = True
+    page_url = f"/event/{args.event_id}/{args.division_id}/{args.team_id}"
+    run(app, "bare", BareRequests(), page_url, args.renders)
+    run(app, "pooled", vb_results.create_session(), page_url, args.renders)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+import vb_results
+
+
+def played(**fields):
+    match = {'play_name': 'Round 1 Pool 2', 'match_name': 'Match 1', 'match_time_raw': '2023-01-28T11:00:00',
+             'court': 'ICC 13', 'team_1_name': 'Tide', 'team_2_name': 'Elevation'}
+    match.update(fields)
+    return match
+
+
+def change_types(before, after):
+    return sorted((change['type'], change['key']) for change in vb_results.diff_snapshots(before, after))
+
+
+def test_no_changes():
+    snapshot = {'match:1': played()}
+    assert vb_results.diff_snapshots(snapshot, dict(snapshot)) == []
+
+
+def test_new_match_and_new_work_assignment():
+    after = {'match:1': played(), 'match:2': played(TeamWorksThisMatch=True)}
+    assert change_types({}, after) == [('match', 'match:1'), ('work', 'match:2')]
+
+
+def test_match_becomes_a_work_assignment():
+    assert change_types({'match:1': played()}, {'match:1': played(TeamWorksThisMatch=True)}) == [('work', 'match:1')]
+
+
+def test_score_court_and_time_changes_carry_the_previous_value():
+    before = {'match:1': played()}
+    after = {'match:1': played(scores='25-18, 25-20', court='ICC 14', match_time_raw='2023-01-28T12:00:00')}
+    changes = {change['type']: change for change in vb_results.diff_snapshots(before, after)}
+    assert sorted(changes) == ['court', 'score', 'time']
+    assert changes['score']['before'] == {'scores': None}
+    assert changes['court']['before'] == {'court': 'ICC 13'}
+    assert changes['time']['before'] == {'match_time_raw': '2023-01-28T11:00:00'}
+    assert changes['court']['match'] == after['match:1']
+
+
+def test_cleared_field_is_not_a_change():
+    assert vb_results.diff_snapshots({'match:1': played(court='ICC 13')}, {'match:1': played(court=None)}) == []
+
+
+def test_bracket_changes():
+    before = {'future:1st-R1 P2': {'rank_text': '1st-R1 P2', 'next_match_court': 'ICC 1'},
+              'future:2nd-R1 P2': {'rank_text': '2nd-R1 P2'}}
+    after = {'future:1st-R1 P2': {'rank_text': '1st-R1 P2', 'next_match_court': 'ICC 2'},
+             'future:3rd-R1 P2': {'rank_text': '3rd-R1 P2'}}
+    changes = vb_results.diff_snapshots(before, after)
+    assert sorted((change['type'], change['key']) for change in changes) == [
+        ('bracket', 'future:1st-R1 P2'), ('bracket', 'future:2nd-R1 P2'), ('bracket', 'future:3rd-R1 P2')]
+    removed = next(change for change in changes if change['key'] == 'future:2nd-R1 P2')
+    assert removed['match'] is None and removed['before'] == before['future:2nd-R1 P2']
+
+
+def test_team_snapshot_keys_and_fields():
+    match = vb_results.MatchRecord('E1', 1, 'Round 1 Pool 2', -57316, -57325, 'Match 1', '1/28 11:00AM',
+                                   '2023-01-28T11:00:00', 'ICC 13', 'Tide', 'Elevation', scores='25-18')
+    snapshot = vb_results.team_snapshot({'past_schedule': [match], 'current_schedule': [], 'future_schedule': []})
+    assert list(snapshot) == ['match:-57325']
+    assert snapshot['match:-57325']['scores'] == '25-18'
+    assert 'TeamWorksThisMatch' not in snapshot['match:-57325']
+
+
+def test_change_log_ignores_snapshots_older_than_the_stored_one(tmp_path):
+    log = vb_results.ChangeLog(str(tmp_path / 'changes.sqlite3'))
+    assert log.record('E1/D1/T1', {'match:1': played()}, as_of=100) == []
+
+    changes = log.record('E1/D1/T1', {'match:1': played(court='ICC 14')}, as_of=200)
+    assert [(change['type'], change['key']) for change in changes] == [('court', 'match:1')]
+
+    # An older cached copy doesn't undo the change
+    assert log.record('E1/D1/T1', {'match:1': played()}, as_of=150) == []
+    assert [change['id'] for change in log.since('E1/D1/T1', 0)] == [changes[0]['id']]
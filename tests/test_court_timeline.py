@@ -0,0 +1,118 @@
+import flask
+import pytest
+
+import vb_results
+
+
+def scheduled(match_id, court, start, end, scored=False):
+    return {'MatchId': match_id, 'MatchFullName': f'Match {-match_id}', 'Court': {'Name': court},
+            'ScheduledStartDateTime': start, 'ScheduledEndDateTime': end, 'HasScores': scored}
+
+
+def pool_sheet(play_id, *matches):
+    return {'Pool': {'PlayId': play_id, 'CompleteFullName': f'Pool {-play_id}'}, 'Matches': list(matches)}
+
+
+def match_ids(timeline, court, after=''):
+    return [match.match_id for match in timeline.court_matches(court, after)]
+
+
+def test_matches_are_ordered_by_start_per_court():
+    timeline = vb_results.CourtTimeline('E1')
+    timeline.update_pool(-1, pool_sheet(-1, scheduled(-12, 'Court 1', '2023-01-28T09:00:00', '2023-01-28T09:59:59'),
+                                        scheduled(-11, 'Court 1', '2023-01-28T08:00:00', '2023-01-28T08:59:59'),
+                                        scheduled(-13, 'Court 10', '2023-01-28T08:00:00', '2023-01-28T08:59:59')), 'D1')
+    timeline.update_pool(-2, pool_sheet(-2, scheduled(-21, 'Court 2', '2023-01-28T08:00:00', '2023-01-28T08:59:59')), 'D2')
+    assert timeline.court_names() == ['Court 1', 'Court 2', 'Court 10']
+    assert match_ids(timeline, 'Court 1') == [-11, -12]
+    assert match_ids(timeline, 'Court 1', after='2023-01-28T08:30:00') == [-12]
+
+
+def test_match_moving_court_and_time():
+    timeline = vb_results.CourtTimeline('E1')
+    timeline.update_pool(-1, pool_sheet(-1, scheduled(-11, 'Court 1', '2023-01-28T08:00:00', '2023-01-28T08:59:59'),
+                                        scheduled(-12, 'Court 1', '2023-01-28T09:00:00', '2023-01-28T09:59:59')), 'D1')
+    timeline.update_pool(-1, pool_sheet(-1, scheduled(-11, 'Court 1', '2023-01-28T08:00:00', '2023-01-28T08:59:59'),
+                                        scheduled(-12, 'Court 3', '2023-01-28T10:00:00', '2023-01-28T10:59:59')), 'D1')
+    assert match_ids(timeline, 'Court 1') == [-11]
+    assert match_ids(timeline, 'Court 3') == [-12]
+    assert timeline.court_matches('Court 3')[0].match_time_raw == '2023-01-28T10:00:00'
+
+
+def test_match_moving_pool_and_emptied_courts():
+    timeline = vb_results.CourtTimeline('E1')
+    timeline.update_pool(-1, pool_sheet(-1, scheduled(-11, 'Court 1', '2023-01-28T08:00:00', '2023-01-28T08:59:59')), 'D1')
+    timeline.update_pool(-2, pool_sheet(-2, scheduled(-11, 'Court 2', '2023-01-28T09:00:00', '2023-01-28T09:59:59')), 'D1')
+    assert timeline.court_names() == ['Court 2']
+    assert timeline.court_matches('Court 2')[0].play_name == 'Pool 2'
+
+    # The old pool's next sheet no longer has the match; it stays with the new pool
+    timeline.update_pool(-1, pool_sheet(-1), 'D1')
+    assert timeline.court_names() == ['Court 2']
+    assert match_ids(timeline, 'Court 2') == [-11]
+
+
+def test_finished_pools_are_marked():
+    timeline = vb_results.CourtTimeline('E1')
+    timeline.update_pool(-1, pool_sheet(-1, scheduled(-11, 'Court 1', '2023-01-28T08:00:00', '2023-01-28T08:59:59', True),
+                                        scheduled(-12, 'Court 1', '2023-01-28T09:00:00', '2023-01-28T09:59:59')), 'D1')
+    assert not timeline.pools[-1][3]
+    timeline.update_pool(-1, pool_sheet(-1, scheduled(-11, 'Court 1', '2023-01-28T08:00:00', '2023-01-28T08:59:59', True),
+                                        scheduled(-12, 'Court 1', '2023-01-28T09:00:00', '2023-01-28T09:59:59', True)), 'D1')
+    assert timeline.pools[-1][3]
+
+
+def test_now_and_next():
+    timeline = vb_results.CourtTimeline('E1')
+    timeline.update_pool(-1, pool_sheet(-1, scheduled(-11, 'Court 1', '2023-01-28T08:00:00', '2023-01-28T08:59:59'),
+                                        scheduled(-12, 'Court 1', '2023-01-28T10:00:00', '2023-01-28T10:59:59')), 'D1')
+
+    def now_and_next(now):
+        return tuple(match and match.match_id for match in timeline.now_and_next('Court 1', now))
+
+    assert now_and_next('2023-01-28T07:00:00') == (None, -11)
+    assert now_and_next('2023-01-28T08:00:00') == (-11, -12)
+    assert now_and_next('2023-01-28T08:30:00') == (-11, -12)
+    assert now_and_next('2023-01-28T09:30:00') == (None, -12)
+    assert now_and_next('2023-01-28T11:30:00') == (None, None)
+    assert timeline.now_and_next('Court 9', '2023-01-28T08:30:00') == (None, None)
+
+    # Moving the later match to the gap changes both answers
+    timeline.update_pool(-1, pool_sheet(-1, scheduled(-11, 'Court 1', '2023-01-28T08:00:00', '2023-01-28T08:59:59'),
+                                        scheduled(-12, 'Court 1', '2023-01-28T09:00:00', '2023-01-28T09:59:59')), 'D1')
+    assert now_and_next('2023-01-28T09:30:00') == (-12, None)
+
+
+
+def query(url):
+    return flask.Flask(__name__).test_request_context(url)
+
+
+def test_time_args_are_normalized(monkeypatch):
+    timeline = vb_results.CourtTimeline('E1')
+    timeline.update_pool(-1, pool_sheet(-1, scheduled(-11, 'Court 1', '2023-01-28T08:00:00', '2023-01-28T08:59:59'),
+                                        scheduled(-12, 'Court 1', '2023-01-28T14:00:00', '2023-01-28T14:59:59')), 'D1')
+    monkeypatch.setattr(vb_results, 'court_timeline', lambda event_id: timeline)
+
+    with query('/?at=2023-01-28T08:30'):
+        assert vb_results.court_time_arg() == '2023-01-28T08:30:00'
+    with query('/?after=14:00&date=2023-01-28'):
+        model = vb_results.court_schedule_model('E1', 'Court 1')
+        assert model['after'] == '2023-01-28T14:00:00'
+        assert [match.match_id for match in model['court_schedule']] == [-12]
+    with query('/?after=2023-01-28T08:00'):
+        assert vb_results.court_schedule_model('E1', 'Court 1')['after'] == '2023-01-28T08:00:00'
+
+
+@pytest.mark.parametrize('url', ['/?at=now', '/?at=2023-13-01T08:00:00'])
+def test_invalid_at(url):
+    with query(url), pytest.raises(ValueError, match='at'):
+        vb_results.court_time_arg()
+
+
+@pytest.mark.parametrize('url', ['/?after=2pm', '/?after=25:00', '/?after=2023-01-28Tnoon',
+                                 '/?after=14:00&date=tomorrow', '/?date=2023-02-30'])
+def test_invalid_after_or_date(url, monkeypatch):
+    monkeypatch.setattr(vb_results, 'court_timeline', lambda event_id: pytest.fail('timeline used'))
+    with query(url), pytest.raises(ValueError):
+        vb_results.court_schedule_model('E1', 'Court 1')
@@ -0,0 +1,43 @@
+import vb_results
+
+
+def index_of(*names):
+    index = vb_results.NgramIndex()
+    for name in names:
+        index.add(name)
+    return index
+
+
+def test_add_returns_positions():
+    index = vb_results.NgramIndex()
+    assert [index.add(name) for name in ('Tide', 'Elevation')] == [0, 1]
+
+
+def test_short_queries_match_substrings():
+    index = index_of('NKYVC 14-2 Tide', 'Elevation 14 Courtney', 'Circle City 14 Black')
+    assert index.search('v') == [0, 1]
+    assert index.search('14') == [0, 1, 2]
+    assert index.search('ci') == [2]
+
+
+def test_long_queries_match_whole_substring_only():
+    index = index_of('Parkansas VBC', 'Park Arkansas', 'Arkansas Park')
+    # Every trigram of the query is in the other names too, but not the query itself
+    assert index.search('parkan') == [0]
+    assert index.search('ark') == [0, 1, 2]
+
+
+def test_search_ignores_case():
+    index = index_of('Elevation 14 Courtney')
+    assert index.search('COURTNEY') == [0]
+
+
+def test_no_match_and_empty_query():
+    index = index_of('Tide', 'Elevation')
+    assert index.search('xyz') == []
+    assert index.search('tidal') == []
+    assert index.search('') == [0, 1]
+
+
+def test_search_on_empty_index():
+    assert vb_results.NgramIndex().search('tide') == []
@@ -0,0 +1,51 @@
+from collections import OrderedDict
+
+import pytest
+
+import vb_results
+
+
+def past_match(match_id, court='ICC 13', scores=((25, 18), (25, 20))):
+    return {
+        'Match': {'MatchId': match_id, 'MatchFullName': f'Match {-match_id}', 'FirstTeamName': 'Tide',
+                  'SecondTeamName': 'Elevation', 'FirstTeamWon': True, 'HasScores': True,
+                  'Sets': [{'FirstTeamScore': first, 'SecondTeamScore': second} for first, second in scores],
+                  'Court': {'Name': court}, 'ScheduledStartDateTime': '2023-01-28T11:00:00'},
+        'Play': {'PlayId': -57316, 'CompleteFullName': 'Round 1 Pool 2'},
+    }
+
+
+@pytest.fixture
+def past_schedule(monkeypatch):
+    monkeypatch.setattr(vb_results, 'past_schedules', OrderedDict())
+    response = {}
+    monkeypatch.setattr(vb_results, 'json_request', lambda url: response['schedule'])
+
+    def convert(schedule):
+        response['schedule'] = schedule
+        return vb_results.convert_schedule_past('E1', 'D1', 'T1')
+    return convert
+
+
+def test_unchanged_response_returns_the_same_records(past_schedule):
+    schedule = [past_match(-1), past_match(-2)]
+    first = past_schedule(schedule)
+    second = past_schedule(schedule)
+    assert first == second and first is not second
+    assert all(a is b for a, b in zip(first, second))
+
+
+def test_new_match_is_converted_and_earlier_ones_reused(past_schedule):
+    first = past_schedule([past_match(-1)])
+    second = past_schedule([past_match(-1), past_match(-2)])
+    assert second[0] is first[0]
+    assert [match.match_id for match in second] == [-1, -2]
+
+
+def test_corrected_match_is_converted_again(past_schedule):
+    first = past_schedule([past_match(-1), past_match(-2)])
+    second = past_schedule([past_match(-1), past_match(-2, court='ICC 14', scores=((25, 18), (23, 25)))])
+    assert second[0] is first[0]
+    assert second[1] is not first[1]
+    assert (second[1].court, second[1].scores) == ('ICC 14', '25-18, 23-25')
+    assert (first[1].court, first[1].scores) == ('ICC 13', '25-18, 25-20')
@@ -0,0 +1,92 @@
+import threading
+import time
+
+import vb_results
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def test_concurrent_callers_share_one_result():
+    flight = vb_results.SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def load(url):
+        calls.append(url)
+        release.wait(5)
+        return {'url': url}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do('a', load, 'a'))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    wait_for(lambda: flight.stats()['deduplicated'] == 4)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert calls == ['a']
+    assert len(results) == 5 and all(result is results[0] for result in results)
+    assert flight.stats() == {'executed': 1, 'deduplicated': 4, 'in_flight': 0}
+
+
+def test_different_keys_run_separately():
+    flight = vb_results.SingleFlight()
+    release = threading.Event()
+    started = []
+
+    def load(key):
+        started.append(key)
+        release.wait(5)
+        return key
+
+    threads = [threading.Thread(target=flight.do, args=(key, load, key)) for key in ('a', 'b')]
+    for thread in threads:
+        thread.start()
+    wait_for(lambda: len(started) == 2)
+    assert flight.stats()['in_flight'] == 2
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert sorted(started) == ['a', 'b']
+
+
+def test_later_call_runs_again():
+    flight = vb_results.SingleFlight()
+    assert [flight.do('a', lambda value: value, value) for value in (1, 2)] == [1, 2]
+    assert flight.stats()['executed'] == 2
+
+
+def test_waiters_get_none_when_the_leader_fails():
+    flight = vb_results.SingleFlight()
+    release = threading.Event()
+
+    def fail():
+        release.wait(5)
+        raise ValueError('upstream')
+
+    errors = []
+
+    def lead():
+        try:
+            flight.do('a', fail)
+        except ValueError as err:
+            errors.append(err)
+
+    results = []
+    leader = threading.Thread(target=lead)
+    leader.start()
+    wait_for(lambda: flight.stats()['in_flight'] == 1)
+    waiter = threading.Thread(target=lambda: results.append(flight.do('a', fail)))
+    waiter.start()
+    wait_for(lambda: flight.stats()['deduplicated'] == 1)
+    release.set()
+    leader.join(5)
+    waiter.join(5)
+    assert len(errors) == 1 and results == [None]
+    assert flight.stats()['in_flight'] == 0
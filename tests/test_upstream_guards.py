@@ -0,0 +1,104 @@
+import pytest
+
+import vb_results
+
+
+# Replaces the clock the breaker and rate limiter read, so tests can move time forward
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(vb_results.time, 'monotonic', clock)
+    monkeypatch.setattr(vb_results.time, 'sleep', lambda seconds: setattr(clock, 'now', clock.now + seconds))
+    return clock
+
+
+def open_breaker(clock, threshold=3, open_seconds=30):
+    breaker = vb_results.CircuitBreaker('aes.test', threshold, open_seconds)
+    for _ in range(threshold):
+        assert breaker.allow()
+        breaker.record(False)
+    return breaker
+
+
+def test_breaker_stays_closed_below_threshold(clock):
+    breaker = vb_results.CircuitBreaker('aes.test', 3, 30)
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record(False)
+    assert breaker.state == 'closed'
+    assert breaker.allow()
+
+
+def test_success_resets_consecutive_failures(clock):
+    breaker = vb_results.CircuitBreaker('aes.test', 3, 30)
+    for healthy in (False, False, True, False, False):
+        assert breaker.allow()
+        breaker.record(healthy)
+    assert breaker.state == 'closed'
+
+
+def test_breaker_opens_at_threshold_and_rejects(clock):
+    breaker = open_breaker(clock)
+    assert breaker.state == 'open'
+    assert not breaker.allow()
+    clock.now += 29
+    assert not breaker.allow()
+
+
+def test_half_open_allows_one_trial(clock):
+    breaker = open_breaker(clock)
+    clock.now += 30
+    assert breaker.allow()
+    assert breaker.state == 'half_open'
+    assert not breaker.allow()
+
+
+def test_successful_trial_closes_breaker(clock):
+    breaker = open_breaker(clock)
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record(True)
+    assert breaker.state == 'closed'
+    assert breaker.failures == 0
+    assert breaker.allow()
+
+
+def test_failed_trial_reopens_breaker(clock):
+    breaker = open_breaker(clock)
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record(False)
+    assert breaker.state == 'open'
+    assert not breaker.allow()
+    # The open period restarts from the failed trial
+    clock.now += 29
+    assert not breaker.allow()
+    clock.now += 1
+    assert breaker.allow()
+    assert breaker.state == 'half_open'
+
+
+def test_token_bucket_allows_burst_then_refills(clock):
+    bucket = vb_results.TokenBucket(rate=2, burst=3)
+    assert all(bucket.acquire(timeout=0) for _ in range(3))
+    assert not bucket.acquire(timeout=0)
+    clock.now += 0.5
+    assert bucket.acquire(timeout=0)
+    assert not bucket.acquire(timeout=0)
+
+
+def test_token_bucket_waits_within_timeout(clock):
+    bucket = vb_results.TokenBucket(rate=2, burst=1)
+    assert bucket.acquire()
+    start = clock.now
+    assert bucket.acquire(timeout=1)
+    assert clock.now - start == pytest.approx(0.5)
+    assert not bucket.acquire(timeout=0.1)
@@ -1,27 +1,694 @@
 #!/usr/bin/env python3
 
-from flask import Flask
-from flask import url_for, render_template, request
+from flask import Flask, Blueprint
+from flask import url_for, render_template, stream_template, get_template_attribute, request, jsonify, make_response, redirect, Response, stream_with_context
+from flask.logging import default_handler
 
 
 import requests
+from requests.adapters import HTTPAdapter
 from requests.exceptions import HTTPError
+from urllib3.util.retry import Retry
 import argparse
 import sys, logging
 from werkzeug.debug import DebuggedApplication
+from jinja2 import FileSystemBytecodeCache
 
+import bisect
+import contextvars
 import datetime
+import fcntl
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlsplit
 
-app = Flask(__name__)
-app.debug = True
-app.wsgi_app = DebuggedApplication(app.wsgi_app, evalex=True)
+# orjson parses and serializes several times faster than json; it is used when installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-base_url="https://results.advancedeventsystems.com"
+# The routes and hooks are registered on a blueprint; create_app() builds the Flask app around it
+bp = Blueprint('vb_results', __name__)
+logger = logging.getLogger('vb_results')
+
+# AES endpoints; point these at aes_standin.py to run without the real service
+base_url = "https://results.advancedeventsystems.com"
+landing_url = "https://advancedeventsystems.com"
+
+# Thread pools for concurrent upstream fetches. Page-level tasks (which may wait on other
+# fetches, e.g. the current schedule waiting on its poolsheets) and leaf fetches get separate
+# pools, so a page task can never starve the fetches it is waiting on.
+page_pool = ThreadPoolExecutor(max_workers=10, thread_name_prefix="vb_page")
+fetch_pool = ThreadPoolExecutor(max_workers=20, thread_name_prefix="vb_fetch")
+
+# Upstream HTTP client settings
+connect_timeout = 3.05
+read_timeout = 10
+max_retries = 2
+retry_backoff = 0.3
+pool_maxsize = 20
+
+# Per-host limits on upstream calls. Calls to a host share a token bucket of upstream_rate_limit
+# calls per second (in bursts of up to upstream_rate_burst) and wait at most upstream_rate_wait
+# seconds for a token. After breaker_failure_threshold consecutive failures the host's circuit
+# breaker opens: calls are rejected without trying the host, and pages are served from the last
+# good data, until a trial call breaker_open_seconds later succeeds.
+upstream_rate_limit = 50
+upstream_rate_burst = 100
+upstream_rate_wait = 2
+breaker_failure_threshold = 5
+breaker_open_seconds = 30
+
+# Creates the HTTP session shared by every thread in the process. The session pools keep-alive
+# connections per host, so repeated AES calls reuse an open TCP+TLS connection instead of
+# handshaking again. Only idempotent GETs are retried, with exponential backoff.
+def create_session():
+    retry = Retry(
+        total=max_retries,
+        connect=max_retries,
+        read=max_retries,
+        status=max_retries,
+        backoff_factor=retry_backoff,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(['GET']),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({'Accept': 'application/json'})
+    return session
+
+http_session = create_session()
+
+# How long (seconds) a cached response for each AES endpoint family is considered fresh.
+# Event metadata rarely changes during a tournament; schedules and poolsheets change within minutes.
+cache_ttls = {
+    'event':            3 * 60 * 60,
+    'team':             20 * 60,
+    'assignments':      5 * 60,
+    'events_list':      30 * 60,
+    'schedule_past':    60,
+    'schedule_current': 20,
+    'schedule_future':  30,
+    'poolsheet':        20,
+}
+cache_max_entries = 2000
+
+# The endpoint families a team's matches are built from (the rest describe events, teams and clubs)
+match_families = ('schedule_past', 'schedule_current', 'schedule_future', 'poolsheet')
+
+# Once a cached response has expired it is still served, and refreshed in the background,
+# until it is this many seconds past its TTL
+max_stale_seconds = 15 * 60
+
+# Maps an AES url to its endpoint family (the key into cache_ttls)
+endpoint_families = [
+    (re.compile(r'/api/event/[^/]+$'), 'event'),
+    (re.compile(r'/api/event/[^/]+/teams/[^/]+$'), 'team'),
+    (re.compile(r'/schedule/past$'), 'schedule_past'),
+    (re.compile(r'/schedule/current$'), 'schedule_current'),
+    (re.compile(r'/schedule/future$'), 'schedule_future'),
+    (re.compile(r'/poolsheet/[^/]+$'), 'poolsheet'),
+    (re.compile(r'/nextassignments\('), 'assignments'),
+    (re.compile(r'/api/landing/events'), 'events_list'),
+]
+
+def endpoint_family(url):
+    path = url.split('?', 1)[0]
+    for pattern, family in endpoint_families:
+        if pattern.search(path):
+            return family
+    return 'other'
+
+
+# The fields of each endpoint family's payload the app reads. fetch_json keeps only these before
+# a response is cached, so the unused bulk of large payloads (team text, video links, the
+# FutureRoundMatches of poolsheets, the landing list's venue and contact details) isn't held in
+# memory for the life of the cache entry. A field maps to None to keep its value as is, or to the
+# fields to keep of its object (or of each object in its list). Families not listed are kept whole.
+court_fields = {'CourtId': None, 'Name': None}
+play_fields = {'PlayId': None, 'CompleteFullName': None}
+match_fields = {
+    'MatchId': None, 'MatchFullName': None, 'HasScores': None, 'ScheduledStartDateTime': None,
+    'ScheduledEndDateTime': None, 'Court': court_fields,
+    'FirstTeamId': None, 'FirstTeamName': None, 'FirstTeamWon': None,
+    'SecondTeamId': None, 'SecondTeamName': None, 'SecondTeamWon': None, 'WorkTeamId': None,
+    'Sets': {'FirstTeamScore': None, 'SecondTeamScore': None},
+}
+next_match_fields = {'MatchId': None, 'Court': court_fields, 'ScheduledStartDateTime': None}
+club_fields = {'ClubId': None, 'Name': None}
+division_fields = {'DivisionId': None, 'Name': None}
+payload_fields = {
+    'event':           {'Key': None, 'Name': None, 'Location': None, 'StartDate': None,
+                        'Clubs': club_fields, 'Divisions': division_fields},
+    'team':            {'TeamName': None, 'TeamClub': club_fields, 'TeamDivision': division_fields},
+    'schedule_past':   {'Match': match_fields, 'Play': play_fields},
+    'schedule_current': {'Play': play_fields},
+    'schedule_future': {'PotentialRank': None, 'PotentialRankText': None, 'NextPlay': play_fields,
+                        'NextMatch': next_match_fields, 'WorkMatch': next_match_fields},
+    'poolsheet':       {'Pool': dict(play_fields, Teams={'TeamId': None}), 'Matches': match_fields},
+    'assignments':     {'value': {'TeamId': None, 'TeamName': None, 'SearchableTeamName': None,
+                                  'TeamClub': club_fields, 'TeamDivision': division_fields}},
+    'events_list':     {'@odata.count': None, 'value': {'eventSchedulerKey': None, 'name': None, 'startDate': None}},
+}
+
+def slim_payload(value, fields):
+    if isinstance(value, list):
+        return [slim_payload(item, fields) for item in value]
+    if not isinstance(value, dict):
+        return value
+    return {name: value[name] if nested is None else slim_payload(value[name], nested)
+            for name, nested in fields.items() if name in value}
+
+
+def json_loads(body):
+    return orjson.loads(body) if orjson is not None else json.loads(body)
+
+# Compact json for responses; records are written as the dicts they stand in for
+def json_dumps(value, sort_keys=False):
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_SORT_KEYS if sort_keys else 0)
+        return orjson.dumps(value, default=json_default, option=option)
+    return json.dumps(value, separators=(',', ':'), sort_keys=sort_keys, default=json_default).encode()
+
+def json_default(value):
+    if isinstance(value, Record):
+        return value.as_dict()
+    return str(value)
+
+
+# A parsed AES response, when it was fetched, and the validators used to revalidate it
+class CacheEntry:
+    __slots__ = ('value', 'fetched_at', 'etag', 'last_modified', 'body_hash')
+
+    def __init__(self, value, fetched_at, etag=None, last_modified=None, body_hash=None):
+        self.value = value
+        self.fetched_at = fetched_at
+        self.etag = etag
+        self.last_modified = last_modified
+        self.body_hash = body_hash
+
+
+# Size-bounded LRU cache of parsed AES responses, keyed by url
+class ResponseCache:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = {}
+        self.stale_hits = {}
+        self.misses = {}
+        self.evictions = 0
+
+    # Returns the CacheEntry for the url if it is younger than max_age + max_stale seconds,
+    # otherwise None
+    def get(self, url, max_age, max_stale=0):
+        family = endpoint_family(url)
+        with self.lock:
+            entry = self.entries.get(url)
+            age = time.time() - entry.fetched_at if entry is not None else None
+            if age is not None and age < max_age + max_stale:
+                self.entries.move_to_end(url)
+                counter = self.hits if age < max_age else self.stale_hits
+                counter[family] = counter.get(family, 0) + 1
+                return entry
+            self.misses[family] = self.misses.get(family, 0) + 1
+            return None
+
+    # Returns the CacheEntry for the url regardless of its age, without counting it as a hit or miss
+    def peek(self, url):
+        with self.lock:
+            return self.entries.get(url)
+
+    def put(self, url, entry):
+        with self.lock:
+            self.entries[url] = entry
+            self.entries.move_to_end(url)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'evictions': self.evictions,
+                'hits': dict(self.hits),
+                'stale_hits': dict(self.stale_hits),
+                'misses': dict(self.misses),
+            }
+
+response_cache = ResponseCache(cache_max_entries)
+
+
+# Coalesces concurrent calls for the same key: the first caller runs the function and every
+# caller that arrives while it is in flight waits for, and shares, its result
+class SingleFlight:
+    class Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.executed = 0
+        self.deduplicated = 0
+
+    def do(self, key, func, *args):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = SingleFlight.Call()
+                self.executed += 1
+            else:
+                self.deduplicated += 1
+
+        if not leader:
+            call.done.wait()
+            return call.result
+
+        try:
+            call.result = func(*args)
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self):
+        with self.lock:
+            return {'executed': self.executed, 'deduplicated': self.deduplicated, 'in_flight': len(self.calls)}
+
+fetch_flight = SingleFlight()
+
+
+# On-disk cache of parsed AES responses, shared by every WSGI daemon process and surviving
+# restarts. When the stored bodies exceed max_bytes, the oldest fetches are evicted.
+cache_db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'vb_results_cache.sqlite3')
+cache_db_max_bytes = 50 * 1024 * 1024
+
+# Base for the stores kept in the shared SQLite database. WAL mode lets readers run concurrently
+# with a writer; each thread gets its own connection.
+class SqliteStore:
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+
+    def connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self.local.conn = conn
+        return conn
+
+
+class DiskCache(SqliteStore):
+    # How many writes between checks of the total size
+    EVICTION_CHECK_INTERVAL = 50
+
+    def __init__(self, path, max_bytes):
+        super().__init__(path)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.connection().executescript('''
+            CREATE TABLE IF NOT EXISTS responses (
+                url           TEXT PRIMARY KEY,
+                family        TEXT NOT NULL,
+                fetched_at    REAL NOT NULL,
+                size          INTEGER NOT NULL,
+                body          TEXT NOT NULL,
+                etag          TEXT,
+                last_modified TEXT,
+                body_hash     TEXT
+            );
+            CREATE INDEX IF NOT EXISTS responses_fetched_at ON responses (fetched_at);
+        ''')
+        self.add_missing_columns()
+
+    # Upgrades cache databases created before the validator columns existed
+    def add_missing_columns(self):
+        conn = self.connection()
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(responses)')}
+        for column in ('etag', 'last_modified', 'body_hash'):
+            if column not in columns:
+                try:
+                    conn.execute(f'ALTER TABLE responses ADD COLUMN {column} TEXT')
+                except sqlite3.OperationalError:
+                    # The other process added it first
+                    pass
+
+    # Returns the CacheEntry for the url, or None
+    def get(self, url):
+        row = self.connection().execute(
+            'SELECT body, fetched_at, etag, last_modified, body_hash FROM responses WHERE url = ?', (url,)).fetchone()
+        with self.lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return CacheEntry(json_loads(row[0]), *row[1:])
+
+    def put(self, url, entry):
+        body = json.dumps(entry.value, separators=(',', ':'))
+        self.connection().execute(
+            '''INSERT OR REPLACE INTO responses (url, family, fetched_at, size, body, etag, last_modified, body_hash)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+            (url, endpoint_family(url), entry.fetched_at, len(body), body, entry.etag, entry.last_modified, entry.body_hash))
+        with self.lock:
+            self.writes += 1
+            check = self.writes % DiskCache.EVICTION_CHECK_INTERVAL == 0
+        if check:
+            self.evict()
+
+    # Deletes the oldest entries until the cache is back under 90% of max_bytes
+    def evict(self):
+        conn = self.connection()
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = total - int(self.max_bytes * 0.9)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            freed = 0
+            urls = []
+            for url, size in conn.execute('SELECT url, size FROM responses ORDER BY fetched_at'):
+                if freed >= target:
+                    break
+                urls.append((url,))
+                freed += size
+            conn.executemany('DELETE FROM responses WHERE url = ?', urls)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        with self.lock:
+            self.evictions += len(urls)
+        logger.info("Evicted %s entries (%s bytes) from the disk cache", len(urls), freed)
+
+    def entries(self, family=None, limit=None):
+        sql = 'SELECT url, family, fetched_at, size FROM responses'
+        params = []
+        if family:
+            sql += ' WHERE family = ?'
+            params.append(family)
+        sql += ' ORDER BY fetched_at DESC'
+        if limit:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        return self.connection().execute(sql, params).fetchall()
+
+    def purge(self, family=None, url_prefix=None, older_than=None):
+        clauses = []
+        params = []
+        if family:
+            clauses.append('family = ?')
+            params.append(family)
+        if url_prefix:
+            clauses.append('substr(url, 1, ?) = ?')
+            params.extend([len(url_prefix), url_prefix])
+        if older_than is not None:
+            clauses.append('fetched_at < ?')
+            params.append(time.time() - older_than)
+        sql = 'DELETE FROM responses'
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        return self.connection().execute(sql, params).rowcount
+
+    def stats(self):
+        count, size = self.connection().execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses').fetchone()
+        with self.lock:
+            return {
+                'path': self.path,
+                'entries': count,
+                'bytes': size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+def open_disk_cache():
+    if not cache_db_path:
+        return None
+    try:
+        return DiskCache(cache_db_path, cache_db_max_bytes)
+    except sqlite3.Error as err:
+        logger.error("Unable to open disk cache %s: %s", cache_db_path, err)
+        return None
+
+disk_cache = None  # opened by create_app
+
+
+# Change detection: the latest snapshot of each team's matches, and a log of the differences
+# between successive snapshots. Change ids are global and increasing, so a client can ask for
+# everything after the last id it saw. Kept in the shared database so both processes agree.
+change_retention_seconds = 4 * 24 * 60 * 60
+
+class ChangeLog(SqliteStore):
+    # How many recorded snapshots between prunes of old changes
+    PRUNE_INTERVAL = 100
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.lock = threading.Lock()
+        self.snapshots_recorded = 0
+        self.connection().executescript('''
+            CREATE TABLE IF NOT EXISTS team_snapshots (
+                team_key   TEXT PRIMARY KEY,
+                updated_at REAL NOT NULL,
+                snapshot   TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS team_changes (
+                id          INTEGER PRIMARY KEY AUTOINCREMENT,
+                team_key    TEXT NOT NULL,
+                detected_at REAL NOT NULL,
+                change      TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS team_changes_team ON team_changes (team_key, id);
+        ''')
+
+    # Stores the snapshot for the team and logs its differences from the previous one. as_of is
+    # when the snapshot's data was fetched (its oldest response); a snapshot older than the stored
+    # one is ignored, so a process serving an older cached copy doesn't undo newer changes.
+    # Returns the new changes.
+    def record(self, team_key, snapshot, as_of):
+        body = json.dumps(snapshot, sort_keys=True, separators=(',', ':'))
+        conn = self.connection()
+        row = conn.execute('SELECT snapshot FROM team_snapshots WHERE team_key = ?', (team_key,)).fetchone()
+        if row is not None and row[0] == body:
+            return []
+
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Re-read under the write lock, the other process may have recorded this change already
+            row = conn.execute('SELECT snapshot, updated_at FROM team_snapshots WHERE team_key = ?', (team_key,)).fetchone()
+            if row is not None and as_of < row[1]:
+                conn.execute('ROLLBACK')
+                return []
+            changes = diff_snapshots(json.loads(row[0]), snapshot) if row is not None else []
+            for change in changes:
+                change['id'] = conn.execute(
+                    'INSERT INTO team_changes (team_key, detected_at, change) VALUES (?, ?, ?)',
+                    (team_key, now, json.dumps(change, separators=(',', ':')))).lastrowid
+                change['detected_at'] = now
+            conn.execute('INSERT OR REPLACE INTO team_snapshots (team_key, updated_at, snapshot) VALUES (?, ?, ?)',
+                         (team_key, as_of, body))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        with self.lock:
+            self.snapshots_recorded += 1
+            prune = self.snapshots_recorded % ChangeLog.PRUNE_INTERVAL == 0
+        if prune:
+            conn.execute('DELETE FROM team_changes WHERE detected_at < ?', (now - change_retention_seconds,))
+        return changes
+
+    # Returns the id of the team's latest change, or 0
+    def latest(self, team_key):
+        row = self.connection().execute('SELECT MAX(id) FROM team_changes WHERE team_key = ?', (team_key,)).fetchone()
+        return row[0] or 0
+
+    # Returns the team's changes with ids after since, oldest first
+    def since(self, team_key, since):
+        changes = []
+        for change_id, detected_at, change in self.connection().execute(
+                'SELECT id, detected_at, change FROM team_changes WHERE team_key = ? AND id > ? ORDER BY id',
+                (team_key, since)):
+            change = json.loads(change)
+            change['id'] = change_id
+            change['detected_at'] = detected_at
+            changes.append(change)
+        return changes
+
+
+def open_change_log():
+    if not cache_db_path:
+        return None
+    try:
+        return ChangeLog(cache_db_path)
+    except sqlite3.Error as err:
+        logger.error("Unable to open change log %s: %s", cache_db_path, err)
+        return None
+
+change_log = None  # opened by create_app
+
+
+# Teams the background poller keeps fresh. Teams are watched while someone has viewed them within
+# watch_expiry_seconds; pinned teams are always watched. Kept in the shared database because page
+# views in either process must reach the one process that runs the poller.
+watch_expiry_seconds = 3 * 60 * 60
+# Pinned teams: [(event_id, division_id, team_id), ...]
+watch_teams = []
+
+class WatchList(SqliteStore):
+    # Don't rewrite a team's last view time more often than this
+    VIEW_WRITE_INTERVAL = 60
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.lock = threading.Lock()
+        self.last_writes = {}
+        self.connection().executescript('''
+            CREATE TABLE IF NOT EXISTS watched_teams (
+                team_key    TEXT PRIMARY KEY,
+                event_id    TEXT NOT NULL,
+                division_id TEXT NOT NULL,
+                team_id     TEXT NOT NULL,
+                last_viewed REAL NOT NULL,
+                pinned      INTEGER NOT NULL DEFAULT 0
+            );
+        ''')
+
+    def viewed(self, event_id, division_id, team_id, pinned=False):
+        team_key = f"{event_id}/{division_id}/{team_id}"
+        now = time.time()
+        with self.lock:
+            if not pinned and now - self.last_writes.get(team_key, 0) < WatchList.VIEW_WRITE_INTERVAL:
+                return
+            self.last_writes[team_key] = now
+        self.connection().execute(
+            '''INSERT INTO watched_teams (team_key, event_id, division_id, team_id, last_viewed, pinned)
+               VALUES (?, ?, ?, ?, ?, ?)
+               ON CONFLICT (team_key) DO UPDATE SET last_viewed = excluded.last_viewed, pinned = MAX(pinned, excluded.pinned)''',
+            (team_key, event_id, division_id, team_id, now, int(pinned)))
+
+    # Returns [(event_id, division_id, team_id)] for the pinned teams and those viewed recently
+    def active(self):
+        conn = self.connection()
+        conn.execute('DELETE FROM watched_teams WHERE pinned = 0 AND last_viewed < ?', (time.time() - watch_expiry_seconds,))
+        return conn.execute('SELECT event_id, division_id, team_id FROM watched_teams ORDER BY team_key').fetchall()
+
+
+def open_watch_list():
+    if not cache_db_path:
+        return None
+    try:
+        return WatchList(cache_db_path)
+    except sqlite3.Error as err:
+        logger.error("Unable to open watch list %s: %s", cache_db_path, err)
+        return None
+
+watch_list = None  # opened by create_app
+
+
+# The fields of a match model that change detection compares
+match_snapshot_fields = ('play_name', 'match_name', 'match_time', 'match_time_raw', 'court', 'team_1_name',
+                         'team_2_name', 'scores', 'TeamWorksThisMatch')
+future_snapshot_fields = ('rank_text', 'play_name', 'next_match_time', 'next_match_court', 'work_time', 'work_court')
+
+# Identifies a match model across snapshots (and the rendered row for it)
+def match_key(match):
+    if 'rank_text' in match:
+        return f"future:{match.get('rank_text')}"
+    return f"match:{match.get('match_id') or (str(match.get('play_id')) + ':' + match.get('match_name', ''))}"
+
+
+# Reduces a team page model to the match fields change detection compares, keyed by match
+def team_snapshot(model):
+    matches = {}
+    for section in ('past_schedule', 'current_schedule'):
+        for match in model.get(section, []):
+            matches[match_key(match)] = {field: match.get(field) for field in match_snapshot_fields if match.get(field)}
+    for match in model.get('future_schedule', []):
+        matches[match_key(match)] = {field: match.get(field) for field in future_snapshot_fields if match.get(field)}
+    return matches
+
+
+# Structured differences between two team snapshots:
+#   match   - a newly scheduled match
+#   work    - a new work assignment
+#   score   - new or changed scores
+#   court   - a match moved courts
+#   time    - a match moved times
+#   bracket - a change in where the team goes next (future schedule)
+def diff_snapshots(before, after):
+    changes = []
+    for key, match in after.items():
+        previous = before.get(key)
+        if key.startswith('future:'):
+            if previous != match:
+                changes.append({'type': 'bracket', 'key': key, 'match': match, 'before': previous})
+            continue
+
+        if previous is None:
+            change_type = 'work' if match.get('TeamWorksThisMatch') else 'match'
+            changes.append({'type': change_type, 'key': key, 'match': match, 'before': None})
+            continue
+        for change_type, field in (('score', 'scores'), ('court', 'court'), ('time', 'match_time_raw')):
+            if match.get(field) != previous.get(field) and match.get(field):
+                changes.append({'type': change_type, 'key': key, 'match': match, 'before': {field: previous.get(field)}})
+        if match.get('TeamWorksThisMatch') and not previous.get('TeamWorksThisMatch'):
+            changes.append({'type': 'work', 'key': key, 'match': match, 'before': None})
+
+    for key, previous in before.items():
+        if key.startswith('future:') and key not in after:
+            changes.append({'type': 'bracket', 'key': key, 'match': None, 'before': previous})
+    return changes
+
+
+# Records the team's current matches with the change log, returning any new changes. Only a
+# model built from complete, fresh data is recorded, as judged by the current trace: an empty or
+# outdated snapshot would log changes that didn't happen, and log them again once the data is
+# back. Change detection must never break a page, so errors are only logged.
+def record_team_snapshot(event_id, division_id, team_id, model):
+    trace = request_trace.get()
+    if change_log is None or trace is None or trace.missing or trace.stale or trace.degraded:
+        return []
+    as_of = trace.oldest_match_fetch if trace.oldest_match_fetch is not None else time.time()
+    try:
+        return change_log.record(f"{event_id}/{division_id}/{team_id}", team_snapshot(model), as_of)
+    except sqlite3.Error as err:
+        logger.error("Unable to record snapshot for %s/%s/%s: %s", event_id, division_id, team_id, err)
+        return []
 
 suppress_logging = False
-def log(msg, level=logging.INFO):
+# Arguments are only formatted into msg if the level is enabled
+def log(msg, *args, level=logging.INFO):
     if not suppress_logging:
-        logging.log(level, msg)
+        logger.log(level, msg, *args)
 
 
 # Formats an ISO-formated timestamp (2023-02-05T11:00:00) to human-friendly (2/5 11:00am)
@@ -33,7 +700,7 @@ def format_time(iso):
         dt = datetime.datetime.strptime(iso, "%Y-%m-%dT%H:%M:%S")
         return dt.strftime("%-m/%-d %-I:%M%p")
     except ValueError as e:
-        app.logger.warn(f"Unable to parse date '{iso}': {str(e)}")
+        logger.warning("Unable to parse date '%s': %s", iso, e)
         return iso
 
 
@@ -44,7 +711,85 @@ def days_delta_at_midnight(num_days):
     return f"{dt.isoformat(sep='T', timespec='milliseconds')}%2B00:00"
 
 
-def match_summary(match_info, play_info, event_id, division_id):
+# Compact, read-only match models. A page holds one per match (hundreds on a division view), so
+# they keep their fields in slots rather than a dict each, but read like the dicts they replace:
+# match['court'], match.get('scores'), 'rank_text' in match, dict(**match). Optional fields are
+# left unset when there is no value, so like a missing dict key they are absent from keys() and
+# as_dict() and render empty in templates.
+class Record:
+    __slots__ = ()
+
+    def __getitem__(self, field):
+        if field in self.__slots__:
+            try:
+                return getattr(self, field)
+            except AttributeError:
+                pass
+        raise KeyError(field)
+
+    def __contains__(self, field):
+        return field in self.__slots__ and hasattr(self, field)
+
+    def get(self, field, default=None):
+        return getattr(self, field, default) if field in self.__slots__ else default
+
+    def keys(self):
+        return [field for field in self.__slots__ if hasattr(self, field)]
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in self.keys()}
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.as_dict()})"
+
+
+# A played, scheduled or worked match (see match_summary); scores only when the match has them
+class MatchRecord(Record):
+    __slots__ = ('event_id', 'division_id', 'play_name', 'play_id', 'match_id', 'match_name', 'match_time',
+                 'match_time_raw', 'court', 'team_1_name', 'team_2_name', 'TeamWorksThisMatch', 'scores')
+
+    def __init__(self, event_id, division_id, play_name, play_id, match_id, match_name, match_time, match_time_raw,
+                 court, team_1_name, team_2_name, TeamWorksThisMatch=False, scores=None):
+        self.event_id = event_id
+        self.division_id = division_id
+        self.play_name = play_name
+        self.play_id = play_id
+        self.match_id = match_id
+        self.match_name = match_name
+        self.match_time = match_time
+        self.match_time_raw = match_time_raw
+        self.court = court
+        self.team_1_name = team_1_name
+        self.team_2_name = team_2_name
+        self.TeamWorksThisMatch = TeamWorksThisMatch
+        if scores is not None:
+            self.scores = scores
+
+
+# Where a team goes next for one potential finish (see convert_schedule_future); work_court only
+# when the team has a work assignment
+class FutureMatchRecord(Record):
+    __slots__ = ('event_id', 'rank_text', 'play_name', 'play_id', 'next_match', 'next_match_court', 'next_match_time',
+                 'next_work', 'work_time', 'work_court')
+
+    def __init__(self, event_id, rank_text, play_name, play_id, next_match, next_match_court, next_match_time,
+                 next_work, work_time, work_court=None):
+        self.event_id = event_id
+        self.rank_text = rank_text
+        self.play_name = play_name
+        self.play_id = play_id
+        self.next_match = next_match
+        self.next_match_court = next_match_court
+        self.next_match_time = next_match_time
+        self.next_work = next_work
+        self.work_time = work_time
+        if work_court is not None:
+            self.work_court = work_court
+
+
+# The match model for a match of a schedule or pool sheet; team_works marks a match the team
+# works rather than plays
+def match_summary(match_info, play_info, event_id, division_id, team_works=False):
 #  play_info {
 #       "Type": 0,
 #       "PlayId": -57316,
@@ -108,61 +853,25 @@ def match_summary(match_info, play_info, event_id, division_id):
 #         "ScheduledStartDateTime": "2023-01-28T11:00:00",
 #         "ScheduledEndDateTime": "2023-01-28T11:59:59"
 #       },
-    match_model = {
-        'event_id':       event_id,
-        'division_id':    division_id,
-        'play_name':      play_info.get('CompleteFullName', ""),
-        'play_id':        play_info.get('PlayId', ""),
-        'match_name':     match_info.get('MatchFullName', ""),
-        'match_time':     format_time(match_info.get('ScheduledStartDateTime', "")),
-        'match_time_raw': match_info.get('ScheduledStartDateTime', ""),
-        'court':          match_info.get('Court',{}).get('Name', ""),
-        'team_1_name':    match_team_name(match_info, 'First'),
-        'team_2_name':    match_team_name(match_info, 'Second'),
-        'TeamWorksThisMatch': match_info.get('TeamWorksThisMatch', False)
-    }
-
-    if match_info.get('HasScores',None):
-        match_model['scores'] = match_scores(match_info)
-
-    return match_model
-
+    return MatchRecord(
+        event_id=       event_id,
+        division_id=    division_id,
+        play_name=      play_info.get('CompleteFullName', ""),
+        play_id=        play_info.get('PlayId', ""),
+        match_id=       match_info.get('MatchId', ""),
+        match_name=     match_info.get('MatchFullName', ""),
+        match_time=     format_time(match_info.get('ScheduledStartDateTime', "")),
+        match_time_raw= match_info.get('ScheduledStartDateTime', ""),
+        court=          (match_info.get('Court') or {}).get('Name', ""),
+        team_1_name=    match_team_name(match_info, 'First'),
+        team_2_name=    match_team_name(match_info, 'Second'),
+        TeamWorksThisMatch=team_works,
+        scores=         match_scores(match_info) if match_info.get('HasScores', None) else None,
+    )
 
-@app.context_processor
-def template_funcs():
-    def render_match(match):
-        # When building the match model, the 'TeamWorksThisMatch' key is set for matches that the selected team is the work team
-        #app.logger.debug(f"render_match: work match {match.get('TeamWorksThisMatch','NOT_THERE')}")
-        if match.get('TeamWorksThisMatch'):
-            return f"{match.get('match_time','')} | {match.get('play_name','')} | {match.get('match_name','')} | WORK | {match.get('court','')}"
-
-        # Otherwise, render a line with match details
-        match_line =  f"{match.get('match_time','')} | {match.get('play_name','')} | {match.get('match_name','')} | {match.get('team_1_name','Team 1')} vs {match.get('team_2_name','Team 2')}"
-        if match.get("scores", None):
-            return f"{match_line} |  {match.get('scores')}"
-        else:
-            return f"{match_line} | {match.get('court','')}"
-    def render_match_table_row(match):
-        event_id = match.get("event_id", "")
-        division_id = match.get("division_id", "")
-        pool_id = match.get("play_id", "")
-        teams = f'{match.get("team_1_name","Team 1")} vs {match.get("team_2_name","Team 2")}'
-        if match.get('TeamWorksThisMatch'):
-            teams = f'WORK'
-
-        match_line = f'<tr class="match play">'
-        match_line = f'{match_line}<td class="match-time">{match.get("match_time","")}</td>'
-        match_line = f'{match_line}<td class="pool"><a href="https://results.advancedeventsystems.com/event/{event_id}/divisions/{division_id}/overview/pool/{pool_id}">{match.get("play_name","")}</a></td>'
-        match_line = f'{match_line}<td class="match-name">{match.get("match_name","")}</td>'
-        match_line = f'{match_line}<td class="teams">{teams}</td>'
-        if match.get("scores", None):
-            match_line = f'{match_line}<td class="scores">{match.get("scores")}</td>'
-        else:
-            match_line = f'{match_line}<td class="court"><a href="https://results.advancedeventsystems.com/event/{event_id}/court-schedule">{match.get("court","")}</a></td>'
-        match_line = f'{match_line}</tr>'
-        return match_line
 
-    return dict(render_match=render_match, render_match_table_row=render_match_table_row)
+# Match rows are rendered by the macros in templates/macros.html, which use match_key
+bp.add_app_template_global(match_key)
 
 
 def match_team_name(match, first_second):
@@ -192,20 +901,501 @@ def match_scores(match):
     return ", ".join(scores)
 
 
+# Prometheus-style counters and histograms for this process. Each daemon process keeps its
+# own, so a scrape through Apache sees whichever process answered.
+class Metrics:
+    BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name, labels=None, amount=1):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, value, labels=None):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * len(Metrics.BUCKETS), 0, 0.0]
+            for i, bound in enumerate(Metrics.BUCKETS):
+                if value <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += 1
+            histogram[2] += value
+
+    @staticmethod
+    def format_labels(labels):
+        if not labels:
+            return ''
+        escaped = (f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+                   for name, value in labels)
+        return '{' + ','.join(escaped) + '}'
+
+    # Prometheus text exposition format; extra_counters and gauges are [(name, labels dict, value)]
+    def render(self, extra_counters=(), gauges=()):
+        lines = []
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = {key: (list(buckets), count, total) for key, (buckets, count, total) in self.histograms.items()}
+        for name, labels, value in extra_counters:
+            counters[(name, tuple(sorted(labels.items())))] = value
+
+        typed = set()
+        for (name, labels), value in sorted(counters.items()):
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{Metrics.format_labels(labels)} {value}")
+        for (name, labels), (buckets, count, total) in sorted(histograms.items()):
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            for bound, bucket_count in zip(Metrics.BUCKETS, buckets):
+                lines.append(f"{name}_bucket{Metrics.format_labels(labels + (('le', bound),))} {bucket_count}")
+            lines.append(f"{name}_bucket{Metrics.format_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{Metrics.format_labels(labels)} {total}")
+            lines.append(f"{name}_count{Metrics.format_labels(labels)} {count}")
+        for name, labels, value in gauges:
+            if name not in typed:
+                lines.append(f"# TYPE {name} gauge")
+                typed.add(name)
+            lines.append(f"{name}{Metrics.format_labels(tuple(sorted(labels.items())))} {value}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+# Send a Server-Timing header with every response; otherwise only when ?timing=1 is passed
+server_timing_enabled = False
+
+
+# Tracks the upstream data used to build the current request's page (its age, and the time
+# spent in each stage). It is held in a context variable, which submit() copies into the pool
+# threads that fetch on the request's behalf.
+class RequestTrace:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.oldest_fetch = None
+        self.oldest_match_fetch = None
+        self.stale = False
+        self.degraded = False
+        self.missing = False
+        self.start = time.perf_counter()
+        self.timings = {}
+        self.upstream_calls = 0
+
+    def add_timing(self, stage, seconds):
+        with self.lock:
+            self.timings[stage] = self.timings.get(stage, 0) + seconds
+
+    def record_upstream_call(self):
+        with self.lock:
+            self.upstream_calls += 1
+
+    # Server-Timing header value. Upstream fetches run in parallel, so their total can exceed the
+    # request's wall time.
+    def server_timing(self):
+        with self.lock:
+            parts = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.timings.items()]
+            parts.append(f'upstream;desc="{self.upstream_calls} calls"')
+        parts.append(f"total;dur={(time.perf_counter() - self.start) * 1000:.1f}")
+        return ", ".join(parts)
+
+    # degraded: the data is the last good copy, served because upstream is failing
+    def record_fetch(self, fetched_at, stale, degraded=False, family=None):
+        with self.lock:
+            if self.oldest_fetch is None or fetched_at < self.oldest_fetch:
+                self.oldest_fetch = fetched_at
+            if family in match_families and (self.oldest_match_fetch is None or fetched_at < self.oldest_match_fetch):
+                self.oldest_match_fetch = fetched_at
+            self.stale = self.stale or stale
+            self.degraded = self.degraded or degraded
+
+    def record_degraded(self):
+        with self.lock:
+            self.degraded = True
+
+    # missing: a fetch failed and there was no copy to serve, so part of the page is empty
+    def record_missing(self):
+        with self.lock:
+            self.missing = True
+
+    # Human-friendly age of the oldest data on the page (ex: "as of 10:42AM, 3 min old"), with a
+    # notice when upstream is degraded or some of the data couldn't be loaded
+    def data_age(self):
+        missing = " (some data could not be loaded from AES)" if self.missing else ""
+        if self.oldest_fetch is None:
+            return f"unavailable{missing}" if self.missing else ("unavailable (upstream degraded)" if self.degraded else "")
+        as_of = datetime.datetime.fromtimestamp(self.oldest_fetch).strftime("%-I:%M%p")
+        minutes = int(time.time() - self.oldest_fetch) // 60
+        age = "just now" if minutes < 1 else f"{minutes} min old"
+        if self.degraded:
+            return f"as of {as_of}, {age} (upstream degraded, showing the last good data){missing}"
+        return f"as of {as_of}, {age}{' (refreshing)' if self.stale else ''}{missing}"
+
+request_trace = contextvars.ContextVar('request_trace', default=None)
+
+@bp.before_app_request
+def start_request_trace():
+    request_trace.set(RequestTrace())
+
+
+@bp.after_app_request
+def finish_request_trace(response):
+    trace = request_trace.get()
+    if trace is None:
+        return response
+    labels = {'endpoint': (request.endpoint or 'none').rpartition('.')[2], 'status': response.status_code}
+    metrics.observe('vb_request_seconds', time.perf_counter() - trace.start, labels)
+    if server_timing_enabled or request.args.get('timing') == '1':
+        response.headers['Server-Timing'] = trace.server_timing()
+    return response
+
+
+# Records the time since start for a stage (upstream_fetch, json_parse, model_build, template_render)
+# in the metrics and the current request's trace
+def record_stage(stage, start, **labels):
+    elapsed = time.perf_counter() - start
+    metrics.observe(f'vb_{stage}_seconds', elapsed, labels)
+    trace = request_trace.get()
+    if trace is not None:
+        trace.add_timing(stage, elapsed)
+
+
+def submit(pool, func, *args):
+    return pool.submit(contextvars.copy_context().run, func, *args)
+
+
+# Limits a rate of calls: acquire() blocks until a token is available, or returns False if it
+# would have to wait longer than timeout. Tokens refill at rate per second up to burst.
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+# Stops calling an upstream host that keeps failing. The breaker is closed while calls succeed;
+# failure_threshold consecutive failures open it, rejecting calls for open_seconds. Then it is
+# half open: one trial call goes through, closing the breaker if it succeeds and reopening it if
+# it fails. State changes and rejections are logged and counted in the metrics.
+class CircuitBreaker:
+    def __init__(self, host, failure_threshold, open_seconds):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    # Returns True if a call may go ahead; the caller must then record() its result
+    def allow(self):
+        with self.lock:
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.open_seconds:
+                self.transition('half_open')
+            if self.state == 'closed':
+                return True
+            if self.state == 'half_open' and not self.trial_running:
+                self.trial_running = True
+                return True
+        metrics.inc('vb_upstream_rejected_total', {'host': self.host, 'reason': 'circuit_open'})
+        return False
+
+    # Records whether an allowed call found the host healthy
+    def record(self, healthy):
+        with self.lock:
+            self.trial_running = False
+            if healthy:
+                self.failures = 0
+                if self.state != 'closed':
+                    self.transition('closed')
+                return
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                if self.state != 'open':
+                    self.transition('open')
+
+    def transition(self, state):
+        level = logging.INFO if state == 'closed' else logging.WARNING
+        logger.log(level, "Circuit breaker for %s: %s -> %s (%d consecutive failures)", self.host, self.state, state, self.failures)
+        metrics.inc('vb_circuit_breaker_transitions_total', {'host': self.host, 'state': state})
+        self.state = state
+
+
+# The rate limiter and circuit breaker for each upstream host, created on first use
+upstream_guards = {}
+upstream_guards_lock = threading.Lock()
+
+def upstream_guard(url):
+    host = urlsplit(url).netloc
+    with upstream_guards_lock:
+        guard = upstream_guards.get(host)
+        if guard is None:
+            guard = upstream_guards[host] = (TokenBucket(upstream_rate_limit, upstream_rate_burst),
+                                             CircuitBreaker(host, breaker_failure_threshold, breaker_open_seconds))
+    return guard
+
+
+# True while the url's host has its circuit breaker open or half open
+def upstream_degraded(url):
+    return upstream_guard(url)[1].state != 'closed'
+
+
+# Overrides how fresh json_request requires data to be, and optionally limits the rate of the
+# upstream calls it makes. The poller uses this to refresh data ahead of page views. max_age only
+# tightens the TTLs of the match_families; event and team info keep their own.
+class FetchPolicy:
+    def __init__(self, max_age, max_stale=0, rate_limiter=None):
+        self.max_age = max_age
+        self.max_stale = max_stale
+        self.rate_limiter = rate_limiter
+
+fetch_policy = contextvars.ContextVar('fetch_policy', default=None)
+
+
+# Runs the given calls concurrently on the pool and returns their results by name
+# calls: { name: (func, arg1, arg2, ...) }
+def run_parallel(pool, calls):
+    futures = {name: submit(pool, *call) for name, call in calls.items()}
+    return {name: future.result() for name, future in futures.items()}
+
+
+# Runs func on each item concurrently on the pool and returns the results in order
+def map_parallel(pool, func, items):
+    futures = [submit(pool, func, item) for item in items]
+    return [future.result() for future in futures]
+
+
+# Like map_parallel, but with at most limit of the items running at a time, so a long list doesn't
+# queue ahead of other requests' work on a shared pool
+def map_bounded(pool, func, items, limit):
+    results = [None] * len(items)
+    queued = iter(range(len(items)))
+    futures = {}
+
+    def start_next():
+        position = next(queued, None)
+        if position is not None:
+            futures[submit(pool, func, items[position])] = position
+
+    for _ in range(limit):
+        start_next()
+    while futures:
+        done, _ = wait(futures, return_when=FIRST_COMPLETED)
+        for future in done:
+            results[futures.pop(future)] = future.result()
+            start_next()
+    return results
+
+
+# Returns the parsed json for the url from the cache when there is a usable copy. Expired
+# copies are served up to max_stale_seconds past their TTL while a background refresh runs.
 def json_request(url):
+    family = endpoint_family(url)
+    max_age = cache_ttls.get(family, 0)
+    max_stale = max_stale_seconds
+    policy = fetch_policy.get()
+    if policy is not None:
+        if family in match_families:
+            max_age = min(max_age, policy.max_age)
+        max_stale = policy.max_stale
+
+    entry = response_cache.get(url, max_age, max_stale)
+    if entry is None:
+        # A rate limited caller waits for its turn here rather than as a single-flight leader,
+        # which would keep the callers waiting on the same url (and their pool workers) with it
+        if policy is not None and policy.rate_limiter is not None:
+            policy.rate_limiter.acquire()
+        entry = fetch_flight.do(url, load_and_cache, url, max_age, max_stale)
+    trace = request_trace.get()
+    if entry is None:
+        if trace is not None:
+            trace.record_missing()
+            if upstream_degraded(url):
+                trace.record_degraded()
+        return {}
+
+    age = time.time() - entry.fetched_at
+    stale = age >= max_age
+    if stale:
+        refresh_in_background(url, max_age)
+    if trace is not None:
+        # Data older than the stale limit is only served when upstream has failed
+        trace.record_fetch(entry.fetched_at, stale, age >= max_age + max_stale or (stale and upstream_degraded(url)),
+                           endpoint_family(url))
+    return entry.value
+
+
+# Loads the url from the disk cache if there is a usable copy there, otherwise fetches it. If
+# the fetch fails (or the circuit breaker rejects it), the last good copy is returned however old
+# it is. Returns the CacheEntry, or None if there is no copy at all.
+def load_and_cache(url, max_age, max_stale):
+    stored = disk_cache_get(url)
+    if stored is not None and time.time() - stored.fetched_at < max_age + max_stale:
+        response_cache.put(url, stored)
+        return stored
+    previous = response_cache.peek(url) or stored
+    entry = fetch_and_cache(url, previous)
+    if entry is None and previous is not None:
+        logger.info("Serving the last good copy of %s, fetched %.0fs ago", url, time.time() - previous.fetched_at)
+        metrics.inc('vb_degraded_responses_total', {'family': endpoint_family(url)})
+        return previous
+    return entry
+
+
+# Fetches the url, revalidating the previous copy if there is one, and caches it before any
+# waiting callers are released
+def fetch_and_cache(url, previous=None):
+    entry = fetch_json(url, previous)
+    if entry is None:
+        return None
+    response_cache.put(url, entry)
+    disk_cache_put(url, entry)
+    return entry
+
+
+refreshing = set()
+refreshing_lock = threading.Lock()
+
+# Refreshes an expired url on the fetch pool, at most once at a time per url
+def refresh_in_background(url, max_age):
+    with refreshing_lock:
+        if url in refreshing:
+            return
+        refreshing.add(url)
+
+    def refresh():
+        try:
+            fetch_flight.do(url, refresh_from_disk_or_upstream, url, max_age)
+        finally:
+            with refreshing_lock:
+                refreshing.discard(url)
+    fetch_pool.submit(refresh)
+
+
+# Another worker may already have refreshed the url into the shared disk cache; that copy is used
+# if it is still within max_age, otherwise the url is fetched again.
+def refresh_from_disk_or_upstream(url, max_age):
+    stored = disk_cache_get(url)
+    if stored is not None and time.time() - stored.fetched_at < max_age:
+        response_cache.put(url, stored)
+        return stored
+    return fetch_and_cache(url, response_cache.peek(url) or stored)
+
+
+# The disk cache is an optimization; errors from it are logged and treated as a miss
+def disk_cache_get(url):
+    if disk_cache is None:
+        return None
+    try:
+        return disk_cache.get(url)
+    except sqlite3.Error as err:
+        logger.error("Disk cache read failed for %s: %s", url, err)
+        return None
+
+
+def disk_cache_put(url, entry):
+    if disk_cache is None:
+        return
+    try:
+        disk_cache.put(url, entry)
+    except sqlite3.Error as err:
+        logger.error("Disk cache write failed for %s: %s", url, err)
+
+
+# Fetches and parses the url from AES, returning a new CacheEntry or None on errors.
+# When there is a previous copy, the request is conditional on its validators. If AES doesn't
+# support validators, a body identical to the previous one is detected by hash and not re-parsed.
+# Calls go through the host's rate limiter and circuit breaker; connection errors, timeouts, 429s
+# and 5xx responses count as failures of the host.
+def fetch_json(url, previous=None):
+    start = time.perf_counter()
+    family = endpoint_family(url)
+    limiter, breaker = upstream_guard(url)
+    if not limiter.acquire(upstream_rate_wait):
+        logger.warning("Rate limit reached for %s, not fetching %s", breaker.host, url)
+        metrics.inc('vb_upstream_rejected_total', {'host': breaker.host, 'reason': 'rate_limited'})
+        metrics.inc('vb_upstream_requests_total', {'family': family, 'outcome': 'rate_limited'})
+        return None
+    if not breaker.allow():
+        logger.info("Circuit open for %s, not fetching %s", breaker.host, url)
+        metrics.inc('vb_upstream_requests_total', {'family': family, 'outcome': 'circuit_open'})
+        return None
+
+    outcome = 'error'
+    healthy = False
+    trace = request_trace.get()
+    if trace is not None:
+        trace.record_upstream_call()
+    headers = {}
+    if previous is not None:
+        if previous.etag:
+            headers['If-None-Match'] = previous.etag
+        if previous.last_modified:
+            headers['If-Modified-Since'] = previous.last_modified
     try:
-        response = requests.get(url)
+        response = http_session.get(url, headers=headers, timeout=(connect_timeout, read_timeout))
+        record_stage('upstream_fetch', start, family=family)
+        healthy = response.status_code < 500 and response.status_code != 429
+        metrics.inc('vb_upstream_bytes_total', {'family': family}, len(response.content))
+        if response.status_code == 304 and previous is not None:
+            logger.info("Not modified: %s", url)
+            outcome = 'not_modified'
+            return CacheEntry(previous.value, time.time(), previous.etag, previous.last_modified, previous.body_hash)
         response.raise_for_status()
+
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        body_hash = hashlib.sha1(response.content).hexdigest()
+        if previous is not None and previous.body_hash == body_hash:
+            logger.info("Unchanged: %s", url)
+            outcome = 'unchanged'
+            return CacheEntry(previous.value, time.time(), etag, last_modified, body_hash)
+        outcome = 'ok'
         if not len(response.content) > 2:
-            app.logger.info(f"URL returned no content: {url}")
-            return []
-        return response.json()
+            logger.info("URL returned no content: %s", url)
+            return CacheEntry([], time.time(), etag, last_modified, body_hash)
+        parse_start = time.perf_counter()
+        content = json_loads(response.content)
+        if family in payload_fields:
+            content = slim_payload(content, payload_fields[family])
+        record_stage('json_parse', parse_start, family=family)
+        return CacheEntry(content, time.time(), etag, last_modified, body_hash)
     except HTTPError as http_err:
-        app.logger.error(f'HTTP error occurred: {http_err}')
-        return {}
+        logger.error("HTTP error occurred: %s", http_err)
+        return None
     except Exception as err:
-        app.logger.error(f'Other error occurred: {err}')
-        return {}
+        logger.error("Other error occurred: %s", err)
+        outcome = 'error'
+        return None
+    finally:
+        breaker.record(healthy)
+        metrics.inc('vb_upstream_requests_total', {'family': family, 'outcome': outcome})
+        logger.info("Fetched %s in %.3fs", url, time.perf_counter() - start)
 
 
 def get_event_info(event_id):
@@ -351,59 +1541,104 @@ def convert_schedule_current(event_id, division_id, team_id):
 #         "ScheduledEndDateTime": "2023-01-28T11:59:59"
 #       },
     url = f'{base_url}/api/event/{event_id}/division/{division_id}/team/{team_id}/schedule/current'
-    app.logger.debug(f"Getting current schedule from {url}")
+    logger.debug("Getting current schedule from %s", url)
     schedule = json_request(url)
+
+    # Fetch all of the pool sheets at once
+    play_ids = [play.get('Play', {}).get('PlayId', None) for play in schedule]
+    play_ids = [play_id for play_id in play_ids if play_id]
+    pool_sheet_urls = [f'{base_url}/api/event/{event_id}/poolsheet/{play_id}' for play_id in play_ids]
+    logger.debug("Getting pool sheets from %s", pool_sheet_urls)
+    pool_sheets = map_parallel(fetch_pool, json_request, pool_sheet_urls)
+
+    build_start = time.perf_counter()
+    index = {}
+    for pool_sheet in pool_sheets:
+        index_poolsheet(pool_sheet, index)
+    matches = indexed_team_matches(index, event_id, division_id, team_id)
+    record_stage('model_build', build_start, schedule='current')
+    return matches
+
+
+# Adds the matches of a pool sheet to index, which maps each team id (as a string; AES ids are
+# numbers, ids from urls are strings) to the (match, play info) pairs it plays or works in.
+# Pool sheet:
+# { 
+#   "Pool": pool info (same as current schedule pool info, with 'Teams': [...])   
+#   "Matches": [] same structure as current schedule
+#   "FutureRoundMatches": [] similar structure to future schedule
+# }
+def index_poolsheet(pool_sheet, index):
+    play_info = pool_sheet.get('Pool',{})
+    for match in pool_sheet.get('Matches', []):
+        for side in ('FirstTeamId', 'SecondTeamId', 'WorkTeamId'):
+            match_team_id = match.get(side)
+            if match_team_id is not None:
+                index.setdefault(str(match_team_id), []).append((match, play_info))
+    return index
+
+
+# The match models for a team from a pool sheet index
+def indexed_team_matches(index, event_id, division_id, team_id):
     matches = []
-    for play in schedule:
-        play_id = play.get('Play', {}).get('PlayId', None)
-        if play_id:
-            # Get the pool sheet
-            url = f'{base_url}/api/event/{event_id}/poolsheet/{play_id}'
-            app.logger.debug(f"Getting pool sheet from {url}")
-            pool_sheet = json_request(url)
-            # { 
-            #   "Pool": pool info (same as current schedule pool info, with 'Teams': [...])   
-            #   "Matches": [] same structure as current schedule
-            #   "FutureRoundMatches": [] similar structure to future schedule
-            # }
-            play_info = pool_sheet.get('Pool',{})
-            
-            # Find all of this team's playing matches or working matches
-            def is_team_match(m):
-                match_teams = [m.get('FirstTeamId',''), m.get('SecondTeamId',''), m.get('WorkTeamId', '')]
-                app.logger.debug(f"Checking match team_id={team_id}, teams={match_teams}, match={team_id in match_teams}")
-                return team_id in match_teams
-            for match in pool_sheet.get('Matches', []):
-                if is_team_match(match):
-                    # Mark the work matches
-                    work_team_id = match.get('WorkTeamId', '')
-                    if team_id == work_team_id:
-                        #app.logger.debug("!!!!!!!!!!!!! WORK MATCH")
-                        match['TeamWorksThisMatch'] = True
-                    matches.append(match_summary(match, play_info, event_id, division_id))                   
+    for match, play_info in index.get(str(team_id), []):
+        team_works = str(team_id) == str(match.get('WorkTeamId', ''))
+        matches.append(match_summary(match, play_info, event_id, division_id, team_works))
     return matches
 
 
+# Past matches already converted, per team: team key -> (the past schedule response they were
+# converted from, {MatchId: (match entry, match model)}, the match models in order). A team's
+# past schedule only grows during an event and a scored match doesn't change, so a page view only
+# converts the matches it hasn't seen before (or that AES has since corrected), and none at all
+# while the cached response is unchanged. Late in an event the cost stays flat.
+past_schedules = OrderedDict()
+past_schedules_lock = threading.Lock()
+past_schedules_max_teams = 5000
+
 def convert_schedule_past(event_id, division_id, team_id):
     url = f'{base_url}/api/event/{event_id}/division/{division_id}/team/{team_id}/schedule/past'
-    app.logger.debug(f"Getting past schedule from {url}")
+    logger.debug("Getting past schedule from %s", url)
     schedule = json_request(url)
 
-    matches = []
-    #app.logger.info(f'Number of matches: {len(schedule)}', logging.DEBUG)
+    build_start = time.perf_counter()
+    team_key = f"{event_id}/{division_id}/{team_id}"
+    with past_schedules_lock:
+        previous = past_schedules.get(team_key)
+    if previous is not None and previous[0] is schedule:
+        record_stage('model_build', build_start, schedule='past')
+        return list(previous[2])
 
     # Schedule is: 
     # [ 
     #   {"Match": {...}, "Play": {...}},   
     # ]
+    known = previous[1] if previous is not None else {}
+    converted = {}
+    matches = []
     for match_play in schedule:
-        play_details = match_play.get('Play',{})
-        log(f'Play: {str(play_details)}', logging.DEBUG)
         match_details = match_play.get('Match', {})
-        log(f'Match: {str(match_details)}', logging.DEBUG)
-        matches.append(match_summary(match_details, play_details, event_id, division_id))
-       
-    return matches
+        match_id = match_details.get('MatchId')
+        seen = known.get(match_id)
+        if seen is not None and seen[0] == match_play:
+            match = seen[1]
+        else:
+            play_details = match_play.get('Play',{})
+            log('Play: %s', play_details, level=logging.DEBUG)
+            log('Match: %s', match_details, level=logging.DEBUG)
+            match = match_summary(match_details, play_details, event_id, division_id)
+            metrics.inc('vb_past_matches_converted_total')
+        if match_id is not None:
+            converted[match_id] = (match_play, match)
+        matches.append(match)
+
+    with past_schedules_lock:
+        past_schedules[team_key] = (schedule, converted, matches)
+        past_schedules.move_to_end(team_key)
+        while len(past_schedules) > past_schedules_max_teams:
+            past_schedules.popitem(last=False)
+    record_stage('model_build', build_start, schedule='past')
+    return list(matches)
 
 
 def convert_schedule_future(event_id, division_id, team_id):
@@ -452,73 +1687,296 @@ def convert_schedule_future(event_id, division_id, team_id):
 #   },
     # 1ST-R1 P9 -> Round 2 Division 1 Challenge Bracket D | Play: 2/5 10:00am Court 17 | Work: 2/5 11:00am Court 17
     url = f'{base_url}/api/event/{event_id}/division/{division_id}/team/{team_id}/schedule/future'
-    app.logger.debug(f"Getting future schedule from {url}")
+    logger.debug("Getting future schedule from %s", url)
     schedule = json_request(url)
+    build_start = time.perf_counter()
     matches = []
     for potential_ranking in schedule:
-        #app.logger.debug(f"potential_ranking {potential_ranking}")
+        #logger.debug(f"potential_ranking {potential_ranking}")
 
         next_match = potential_ranking.get('NextMatch',{}) or {}
-        #app.logger.debug(f"NextMatch {next_match}")
+        #logger.debug(f"NextMatch {next_match}")
 
         next_work = potential_ranking.get('WorkMatch',{}) or {}
         next_play = potential_ranking.get('NextPlay',{}) or {}
         next_court = (next_match.get('Court',{}) or {})
         work_court = (next_work.get('Court',{}) or {})
 
-        match = { 
-        'event_id': event_id,
-        'rank_text': potential_ranking.get('PotentialRankText', potential_ranking.get('PotentialRank', '')),
-        'play_name': next_play.get('CompleteFullName'),
-        'play_id': next_play.get('PlayId'),
-        'next_match': next_match,
-        'next_match_court': next_court.get('Name',''),
-        'next_match_time': format_time(next_match.get('ScheduledStartDateTime','')),
-        'next_work': next_work,
-        #'work_court': next_work.get('Court',{}).get('Name',''),
-        'work_time': format_time(next_work.get('ScheduledStartDateTime',''))
-        }
-        work_court = next_work.get('Court',{})
-        if work_court:
-            match['work_court']=work_court.get('Name', '')
-        matches.append(match)
+        matches.append(FutureMatchRecord(
+            event_id=event_id,
+            rank_text=potential_ranking.get('PotentialRankText', potential_ranking.get('PotentialRank', '')),
+            play_name=next_play.get('CompleteFullName'),
+            play_id=next_play.get('PlayId'),
+            next_match=next_match,
+            next_match_court=next_court.get('Name',''),
+            next_match_time=format_time(next_match.get('ScheduledStartDateTime','')),
+            next_work=next_work,
+            work_time=format_time(next_work.get('ScheduledStartDateTime','')),
+            work_court=work_court.get('Name', '') if work_court else None,
+        ))
 
+    record_stage('model_build', build_start, schedule='future')
     return matches
 
-@app.route("/")
+# Page versions for conditional responses: page key -> (etag, first time this process served it)
+page_versions = OrderedDict()
+page_versions_lock = threading.Lock()
+page_versions_max = 5000
+
+def page_version(key, data):
+    etag = hashlib.sha1(json_dumps(data, sort_keys=True)).hexdigest()
+    with page_versions_lock:
+        version = page_versions.get(key)
+        if version is None or version[0] != etag:
+            now = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+            version = page_versions[key] = (etag, now)
+        page_versions.move_to_end(key)
+        while len(page_versions) > page_versions_max:
+            page_versions.popitem(last=False)
+    return version
+
+
+# Returns a response with an ETag and Last-Modified computed from the data the page is built
+# from. If the client already has this version, answers 304 without calling render (unless the
+# page is built from degraded or missing upstream data, so the client sees the notice).
+def conditional_response(key, data, render):
+    etag, last_modified = page_version(key, data)
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains(etag)
+    else:
+        not_modified = request.if_modified_since is not None and request.if_modified_since >= last_modified
+    trace = request_trace.get()
+    if trace is not None and (trace.degraded or trace.missing):
+        not_modified = False
+
+    response = Response(status=304) if not_modified else make_response(render())
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    return response
+
+
+def render_timed(template, **context):
+    start = time.perf_counter()
+    html = render_template(template, **context)
+    record_stage('template_render', start, template=template)
+    return html
+
+
+@bp.route("/metrics")
+def metrics_page():
+    extra = []
+    cache = response_cache.stats()
+    for result, counts in (('hit', cache['hits']), ('stale', cache['stale_hits']), ('miss', cache['misses'])):
+        for family, count in counts.items():
+            extra.append(('vb_cache_lookups_total', {'tier': 'memory', 'family': family, 'result': result}, count))
+    extra.append(('vb_cache_evictions_total', {'tier': 'memory'}, cache['evictions']))
+    if disk_cache is not None:
+        disk = disk_cache.stats()
+        extra.append(('vb_cache_lookups_total', {'tier': 'disk', 'family': 'all', 'result': 'hit'}, disk['hits']))
+        extra.append(('vb_cache_lookups_total', {'tier': 'disk', 'family': 'all', 'result': 'miss'}, disk['misses']))
+        extra.append(('vb_cache_evictions_total', {'tier': 'disk'}, disk['evictions']))
+    flight = fetch_flight.stats()
+    extra.append(('vb_single_flight_total', {'result': 'executed'}, flight['executed']))
+    extra.append(('vb_single_flight_total', {'result': 'deduplicated'}, flight['deduplicated']))
+    with upstream_guards_lock:
+        breakers = [breaker for _, breaker in upstream_guards.values()]
+    gauges = [('vb_circuit_breaker_open', {'host': breaker.host}, int(breaker.state != 'closed')) for breaker in breakers]
+    return Response(metrics.render(extra, gauges), mimetype='text/plain; version=0.0.4')
+
+
+@bp.route("/cache/stats")
+def cache_stats():
+    stats = response_cache.stats()
+    stats['single_flight'] = fetch_flight.stats()
+    if disk_cache is not None:
+        stats['disk'] = disk_cache.stats()
+    with upstream_guards_lock:
+        stats['circuit_breakers'] = {host: breaker.state for host, (_, breaker) in upstream_guards.items()}
+    return jsonify(stats)
+
+
+@bp.route("/")
 def root_page():
-    return app.redirect(url_for('event_list'))
+    return redirect(url_for('.event_list'))
 
 
-@app.route("/events")
+@bp.route("/events")
 def event_list():
 # Event listing
 # (old) https://results.advancedeventsystems.com/odata/events/scheduler?$orderby=StartDate,Name&$filter=(EndDate+gt+2023-01-23T00:00:00.000Z+and+StartDate+lt+2023-03-01T00:00:00.000Z)
 #    url = f"{base_url}/odata/events/scheduler?$orderby=StartDate,Name&$filter=(EndDate+lt+{end_date}+and+StartDate+gt+{start_date})"
 
 # https://advancedeventsystems.com/api/landing/events?$count=true&$filter=(startDate+gt+2023-03-01T04:00:00%2B00:00+and+endDate+le+2023-04-01T04:00:00%2B00:00)&$format=json&$orderby=startDate,name&$top=100
-    # TODO: Support date filtering using parameters
-    start_date = days_delta_at_midnight(-10)
-    end_date = days_delta_at_midnight(40)
-    # date format: 2023-03-01T00:00:00.000Z
-    url = f"https://advancedeventsystems.com/api/landing/events?$count=true&$filter=(startDate+gt+{start_date}+and+endDate+le+{end_date})&$format=json&$orderby=startDate,name&$top=1000"
-    # log(f"Getting events from {url}", logging.ERROR)
-    json_content = json_request(url)
-    events = json_content.get("value", [])
-    # log(f"events: {events}",logging.ERROR)
-    output = ["<table><tr><th>Event</th><th>Date</th></tr>"]
-    for event in events:
-        # log(f"event: {event}",logging.ERROR)
-        event_date = event.get("startDate", "").split("T")[0]
-        event_id = event.get("eventSchedulerKey",None)
-        if event_id:
-            output.append(f'<tr><td><a href="{url_for("event_clubs", event_id=event_id)}">{event.get("name","Unknown")}</a></td><td>{event_date}</td></tr>')
-    output.append("</table>")
-    # return output
-    return "\n".join(output)
-
-
-@app.route("/event/<event_id>")
+    return render_timed("event_list.html", **event_list_model(**event_list_args()))
+
+
+# Substring index over names: maps every 1..n character gram of each (lowercased) name to the
+# positions holding it. A search intersects the posting sets of the query's grams, smallest first,
+# and only checks the surviving candidates, instead of scanning every name.
+class NgramIndex:
+    def __init__(self, n=3):
+        self.n = n
+        self.names = []
+        self.grams = {}
+
+    def add(self, name):
+        name = name.lower()
+        position = len(self.names)
+        self.names.append(name)
+        for size in range(1, self.n + 1):
+            for start in range(len(name) - size + 1):
+                self.grams.setdefault(name[start:start + size], set()).add(position)
+        return position
+
+    # Sorted positions of the names containing query
+    def search(self, query):
+        query = query.lower()
+        if not query:
+            return list(range(len(self.names)))
+        size = min(self.n, len(query))
+        postings = sorted((self.grams.get(query[start:start + size], set()) for start in range(len(query) - size + 1)), key=len)
+        candidates = set.intersection(*postings)
+        if len(query) > self.n:
+            candidates = [position for position in candidates if query in self.names[position]]
+        return sorted(candidates)
+
+
+# An in-memory index built from cached AES responses. The first use builds it; after that it is
+# served as is and checked in the background at most every index_check_interval seconds, the
+# subclass's rebuild() updating it only if the cached responses changed.
+index_check_interval = 60
+
+class RefreshingIndex:
+    def __init__(self):
+        self.state = None
+        self.checked_at = 0
+        self.lock = threading.Lock()
+        self.refreshing = False
+
+    def current(self):
+        if self.state is None:
+            with self.lock:
+                if self.state is None:
+                    self.checked_at = time.time()
+                    self.rebuild()
+        elif time.time() - self.checked_at > index_check_interval and not self.refreshing:
+            self.refreshing = True
+            page_pool.submit(self.refresh)
+        return self.state
+
+    def refresh(self):
+        try:
+            with self.lock:
+                self.checked_at = time.time()
+                self.rebuild()
+        except Exception as err:
+            logger.error("%s refresh failed: %s", type(self).__name__, err)
+        finally:
+            self.refreshing = False
+
+    def rebuild(self):
+        raise NotImplementedError
+
+
+# The landing API's events from event_index_days_before days ago to event_index_days_after days
+# ahead, sorted by start date, with a name index. Pages are served from the index, so page views
+# make no upstream calls.
+event_index_days_before = 30
+event_index_days_after = 120
+event_index_page_size = 1000
+
+class EventIndex(RefreshingIndex):
+    # Loads the window's events (in pages of event_index_page_size) and rebuilds the index if the
+    # landing responses changed
+    def rebuild(self):
+        start_date = days_delta_at_midnight(-event_index_days_before)
+        end_date = days_delta_at_midnight(event_index_days_after)
+        # date format: 2023-03-01T00:00:00.000Z
+        sources = []
+        while True:
+            url = (f"{landing_url}/api/landing/events?$count=true&$filter=(startDate+gt+{start_date}+and+endDate+le+{end_date})"
+                   f"&$format=json&$orderby=startDate,name&$top={event_index_page_size}&$skip={len(sources) * event_index_page_size}")
+            json_content = json_request(url)
+            sources.append(json_content)
+            page = json_content.get("value", [])
+            if len(page) < event_index_page_size or len(sources) * event_index_page_size >= json_content.get("@odata.count", 0):
+                break
+        if self.state is not None and len(sources) == len(self.state['sources']) and \
+                all(source is previous for source, previous in zip(sources, self.state['sources'])):
+            return
+
+        events = {}
+        for json_content in sources:
+            for event in json_content.get("value", []):
+                event_id = event.get("eventSchedulerKey",None)
+                if event_id:
+                    events[event_id] = {
+                        'event_id': event_id,
+                        'name': event.get("name","Unknown"),
+                        'date': event.get("startDate", "").split("T")[0],
+                    }
+        events = sorted(events.values(), key=lambda event: (event['date'], event['name']))
+        names = NgramIndex()
+        for event in events:
+            names.add(event['name'])
+        self.state = {'sources': sources, 'events': events, 'dates': [event['date'] for event in events], 'names': names}
+
+event_index = EventIndex()
+
+
+def parse_date(text, default):
+    try:
+        return datetime.date.fromisoformat(text).isoformat() if text else default
+    except ValueError:
+        return default
+
+
+# A page of the event list. start and end (YYYY-MM-DD) bound the events' start dates and default
+# to 10 days ago and 40 days ahead, and are narrowed to the index's window (clamped is then set);
+# q matches anywhere in the event name.
+def event_list_model(start=None, end=None, query='', page=1, per_page=50):
+    today = datetime.date.today()
+    start = parse_date(start, (today - datetime.timedelta(days=10)).isoformat())
+    end = parse_date(end, (today + datetime.timedelta(days=40)).isoformat())
+    # The index only holds its window's events; list the part of the range it covers
+    requested = (start, end)
+    start = max(start, (today - datetime.timedelta(days=event_index_days_before)).isoformat())
+    end = min(end, (today + datetime.timedelta(days=event_index_days_after)).isoformat())
+    index = event_index.current()
+
+    # Events are sorted by date, so the date range is a slice of positions
+    first = bisect.bisect_left(index['dates'], start)
+    last = bisect.bisect_right(index['dates'], end)
+    if query:
+        positions = index['names'].search(query)
+        positions = positions[bisect.bisect_left(positions, first):bisect.bisect_left(positions, last)]
+    else:
+        positions = range(first, last)
+
+    per_page = max(1, min(per_page, 200))
+    pages = max(1, -(-len(positions) // per_page))
+    page = max(1, min(page, pages))
+    return {
+        'events': [index['events'][position] for position in positions[(page - 1) * per_page:page * per_page]],
+        'total': len(positions),
+        'page': page,
+        'pages': pages,
+        'per_page': per_page,
+        'start': start,
+        'end': end,
+        'clamped': (start, end) != requested,
+        'q': query,
+    }
+
+
+def event_list_args():
+    args = request.args
+    return dict(start=args.get('start'), end=args.get('end'), query=args.get('q', '').strip(),
+                page=args.get('page', default=1, type=int), per_page=args.get('per_page', default=50, type=int))
+
+
+@bp.route("/event/<event_id>")
 def event_clubs(event_id):
 # Event clubs and divisions (get club id by name)
 # https://results.advancedeventsystems.com/api/event/{event_id}
@@ -548,24 +2006,25 @@ def event_clubs(event_id):
 #        },
 #    ]
 #}
+    return render_timed("event_clubs.html", **event_model(event_id))
+
+
+def event_model(event_id):
     url = f"{base_url}/api/event/{event_id}"
     json_content = json_request(url)
-    event_name = json_content.get('Name', "")
-    location = json_content.get('Location', "")
-    date = json_content.get('StartDate','').split("T")[0]
-    output = [f"<h1>{event_name}</h1>"]
-    output.append(f"<h2>{date} - {location}</h2>")
-    output.append(f"<h3>Clubs</h3>")
-
-    for club in json_content.get('Clubs',[]):
-        club_name = club.get('Name','Unknown')
-        club_id = club.get('ClubId','')
-        club_url = url_for("event_club_teams", event_id=event_id, club_id=club_id)
-        output.append(f'<a href="{club_url}">{club_name}</a>')
-    return "<br/>".join(output)
-
-
-@app.route("/event/<event_id>/<club_id>")
+    return {
+        'event_id': event_id,
+        'name': json_content.get('Name', ""),
+        'location': json_content.get('Location', ""),
+        'date': json_content.get('StartDate','').split("T")[0],
+        'divisions': [{'division_id': division.get('DivisionId',''), 'name': division.get('Name','Unknown')}
+                      for division in json_content.get('Divisions',[])],
+        'clubs': [{'club_id': club.get('ClubId',''), 'name': club.get('Name','Unknown')}
+                  for club in json_content.get('Clubs',[])],
+    }
+
+
+@bp.route("/event/<event_id>/<club_id>")
 def event_club_teams(event_id, club_id):
 # Club teams (get division id and team id for club id + team name)
 # https://results.advancedeventsystems.com/odata/{event_id}/nextassignments(dId=null,cId={club_id},tIds=[])?$orderby=TeamName,TeamCode
@@ -600,40 +2059,1187 @@ def event_club_teams(event_id, club_id):
 #        },
 #    ]
 # }        
-    output = []
-    event_info = get_event_info(event_id)
-    output.append(f"<h1>{event_info.get('name','')}</h1>")
-    output.append(f"<h2>{event_info.get('date','')} - {event_info.get('location','')}</h2>")
-    url = f"{base_url}/odata/{event_id}/nextassignments(dId=null,cId={club_id},tIds=[])?$orderby=TeamName,TeamCode"
-    json_content = json_request(url)
-    club_name = json_content.get('value',[{}])[0].get('TeamClub',{}).get('Name','')
-    output.append(f"<h3>{club_name}</h3>")
-    teams = json_content.get('value',[])
+    model = club_teams_model(event_id, club_id)
+    model['data_age'] = request_trace.get().data_age()
+    prefetch_teams(event_id, model['teams'])
+    return render_timed("event_club_teams.html", **model)
+
+
+# The nextassignments listing of a division's or a club's teams
+def assignments_url(event_id, division_id='null', club_id='null'):
+    return f"{base_url}/odata/{event_id}/nextassignments(dId={division_id},cId={club_id},tIds=[])?$orderby=TeamName,TeamCode"
+
+
+def club_teams_model(event_id, club_id):
+    url = assignments_url(event_id, club_id=club_id)
+    model = {'event_id': event_id, 'club_id': club_id}
+    model.update(run_parallel(page_pool, {
+        'event_info':  (get_event_info, event_id),
+        'assignments': (json_request, url),
+    }))
+    teams = model.pop('assignments').get('value',[])
+    model['club_name'] = (teams[0].get('TeamClub') or {}).get('Name','') if teams else ''
+    model['teams'] = []
     for team in teams:
-        team_name = team.get('TeamName','Unknown')
-        team_id = team.get('TeamId','')
-        division = team.get('TeamDivision', {})
-        division_name = division.get('Name', 'Unknown')
-        division_id = division.get('DivisionId', '')
-        team_url = url_for("team_page", event_id=event_id, division_id=division_id, team_id=team_id)
-        output.append(f'<a href="{team_url}">{team_name} ({division_name})</a>')
-    return "<br/>".join(output)
+        division = team.get('TeamDivision') or {}
+        model['teams'].append({
+            'team_id': team.get('TeamId',''),
+            'name': team.get('TeamName','Unknown'),
+            'division': division.get('Name', 'Unknown'),
+            'division_id': division.get('DivisionId', ''),
+        })
+    return model
+
+
+# Per-event index of every club and team for typeahead search: n-gram indexes over the clubs'
+# names and the teams' SearchableTeamName, built from the event and the event-wide
+# nextassignments listing. Updates are incremental: only new or renamed teams and clubs are added
+# to the n-gram indexes, and positions left behind by renamed or removed entries are skipped
+# when searching. Searches never call AES.
+team_index_max_events = 50
+
+class TeamIndex(RefreshingIndex):
+    def __init__(self, event_id):
+        super().__init__()
+        self.event_id = event_id
+        self.search_lock = threading.Lock()
+        self.entries = {'team': {}, 'club': {}}
+        self.names = {'team': NgramIndex(), 'club': NgramIndex()}
+        self.positions = {'team': [], 'club': []}
+
+    def rebuild(self):
+        sources = run_parallel(fetch_pool, {
+            'event':       (json_request, f"{base_url}/api/event/{self.event_id}"),
+            'assignments': (json_request, assignments_url(self.event_id)),
+        })
+        if self.state is not None and all(sources[name] is self.state[name] for name in sources):
+            return
+
+        clubs = {club.get('ClubId'): {'club_id': club.get('ClubId'), 'name': club.get('Name', '')}
+                 for club in sources['event'].get('Clubs', []) if club.get('ClubId') is not None}
+        teams = {}
+        for team in sources['assignments'].get('value', []):
+            if team.get('TeamId') is None:
+                continue
+            club = team.get('TeamClub') or {}
+            division = team.get('TeamDivision') or {}
+            teams[team['TeamId']] = {
+                'team_id': team['TeamId'],
+                'name': team.get('TeamName', ''),
+                'search_name': team.get('SearchableTeamName') or team.get('TeamName', ''),
+                'club_name': club.get('Name', ''),
+                'division': division.get('Name', ''),
+                'division_id': division.get('DivisionId', ''),
+            }
+            if club.get('ClubId') is not None and club['ClubId'] not in clubs:
+                clubs[club['ClubId']] = {'club_id': club['ClubId'], 'name': club.get('Name', '')}
+
+        with self.search_lock:
+            self.update('team', teams, 'search_name')
+            self.update('club', clubs, 'name')
+        self.state = sources
 
+    def update(self, kind, entries, name_field):
+        previous = self.entries[kind]
+        for key, entry in entries.items():
+            old = previous.get(key)
+            if old is not None and old[name_field].lower() == entry[name_field].lower():
+                entry['position'] = old['position']
+            else:
+                entry['position'] = self.names[kind].add(entry[name_field])
+                self.positions[kind].append(key)
+        self.entries[kind] = entries
 
-@app.route("/event/<event_id>/<division_id>/<team_id>")
+    # Up to limit entries of kind ('team' or 'club') whose names contain query, names starting
+    # with it first
+    def search(self, kind, query, limit=10):
+        query = query.lower()
+        with self.search_lock:
+            entries = self.entries[kind]
+            found = []
+            for position in self.names[kind].search(query):
+                entry = entries.get(self.positions[kind][position])
+                if entry is not None and entry['position'] == position:
+                    found.append(entry)
+        name_field = 'search_name' if kind == 'team' else 'name'
+        found.sort(key=lambda entry: (not entry[name_field].lower().startswith(query), entry[name_field].lower()))
+        return found[:limit]
+
+team_indexes = OrderedDict()
+team_indexes_lock = threading.Lock()
+
+def team_index(event_id):
+    with team_indexes_lock:
+        index = team_indexes.get(event_id)
+        if index is None:
+            index = team_indexes[event_id] = TeamIndex(event_id)
+        team_indexes.move_to_end(event_id)
+        while len(team_indexes) > team_index_max_events:
+            team_indexes.popitem(last=False)
+    index.current()
+    return index
+
+
+# Typeahead search of an event's teams and clubs:
+#   { "teams": [ { "team_id", "name", "club_name", "division", "division_id", "url" } ], "clubs": [ { "club_id", "name", "url" } ] }
+@bp.route("/api/v1/event/<event_id>/search")
+def api_event_search(event_id):
+    query = request.args.get('q', '').strip()
+    limit = max(1, min(request.args.get('limit', default=10, type=int), 50))
+    if not query:
+        return jsonify({'teams': [], 'clubs': []})
+    index = team_index(event_id)
+    teams = [dict({field: team[field] for field in ('team_id', 'name', 'club_name', 'division', 'division_id')},
+                  url=url_for('.team_page', event_id=event_id, division_id=team['division_id'], team_id=team['team_id']))
+             for team in index.search('team', query, limit)]
+    clubs = [dict(club_id=club['club_id'], name=club['name'],
+                  url=url_for('.event_club_teams', event_id=event_id, club_id=club['club_id']))
+             for club in index.search('club', query, limit)]
+    return Response(json_dumps({'teams': teams, 'clubs': clubs}), mimetype='application/json')
+
+
+# Builds the team page model: team and event info plus the past, current and future schedules
+def team_page_model(event_id, division_id, team_id):
+    model = { 'event_id': event_id, 'division_id': division_id, 'team_id': team_id}
+
+    # All of the page's upstream calls are independent, so fetch them together
+    start = time.perf_counter()
+    model.update(run_parallel(page_pool, {
+        'team_info':        (get_team_info, event_id, team_id),
+        'event_info':       (get_event_info, event_id),
+        'past_schedule':    (get_team_schedule, event_id, division_id, team_id, 'past'),
+        'current_schedule': (get_team_schedule, event_id, division_id, team_id, 'current'),
+        'future_schedule':  (get_team_schedule, event_id, division_id, team_id, 'future'),
+    }))
+    logger.info("Fetched team page data for %s/%s/%s in %.3fs", event_id, division_id, team_id, time.perf_counter() - start)
+    return model
+
+
+@bp.route("/event/<event_id>/<division_id>/<team_id>")
 def team_page(event_id, division_id, team_id):
     args = request.args
     format = args.get('fmt', default="rich")
-    model = { 'event_id': event_id, 'division_id': division_id, 'team_id': team_id}
-    model['team_info'] = get_team_info(event_id, team_id)
-    event_info = get_event_info(event_id)
-    model['event_info'] = event_info
+    model = team_page_model(event_id, division_id, team_id)
+    record_team_snapshot(event_id, division_id, team_id, model)
+    watch_team(event_id, division_id, team_id)
+    page_data = dict(model, format=format)
+    model['data_age'] = request_trace.get().data_age()
+    model['change_token'] = latest_change_token(event_id, division_id, team_id)
+    model['change_poll_interval'] = change_poll_interval
+
+    # The plain format keeps its body to the schedule; the data age goes in a header instead
+    def render():
+        response = make_response(render_timed(f"team_page_{format}.html", **model))
+        if format == 'plain' and model['data_age']:
+            response.headers['X-Data-Age'] = model['data_age']
+        return response
+
+    return conditional_response(('team_page', event_id, division_id, team_id, format), page_data, render)
+
+
+# Changes to the team's matches since the given change id, as JSON:
+#   { "token": <id to pass as since next time>, "changes": [ { "id", "type", "key", "match", "before", "detected_at" } ] }
+@bp.route("/event/<event_id>/<division_id>/<team_id>/changes")
+@bp.route("/api/v1/event/<event_id>/division/<division_id>/team/<team_id>/changes")
+def team_changes(event_id, division_id, team_id):
+    since = request.args.get('since', default=0, type=int)
+    if change_log is None:
+        return jsonify({'error': 'Change detection is not available'}), 503
+
+    record_team_snapshot(event_id, division_id, team_id, team_page_model(event_id, division_id, team_id))
+    try:
+        changes = change_log.since(f"{event_id}/{division_id}/{team_id}", since)
+    except sqlite3.Error as err:
+        logger.error("Unable to read changes for %s/%s/%s: %s", event_id, division_id, team_id, err)
+        return jsonify({'error': 'Change detection is not available'}), 503
+    token = changes[-1]['id'] if changes else since
+    return jsonify({'token': token, 'changes': changes})
+
+
+# Division and club schedule views. Every listed team's current round is built from one pass over
+# the round's pool sheets, each loaded once, rather than one poolsheet fetch and scan per team.
+
+# How many teams' current schedules division_pool_sheets fetches at a time while finding pools
+pool_discovery_batch = 4
+
+
+# Loads the current round pool sheets for the given teams of a division. A team's current
+# schedule is only fetched (to find its pools) if no pool sheet loaded so far lists the team,
+# so the upstream calls grow with the number of pools rather than the number of teams.
+def division_pool_sheets(event_id, division_id, team_ids):
+    pool_sheets = OrderedDict()
+    covered = set()
+    pending = [str(team_id) for team_id in team_ids]
+    while pending:
+        # Once some pools are known, fetch about one schedule per pool the pending teams still need
+        batch_size = pool_discovery_batch
+        if pool_sheets:
+            batch_size = max(1, min(batch_size, -(-len(pending) * len(pool_sheets) // len(covered))))
+        batch = pending[:batch_size]
+        schedule_urls = [f'{base_url}/api/event/{event_id}/division/{division_id}/team/{team_id}/schedule/current'
+                         for team_id in batch]
+        play_ids = []
+        for schedule in map_parallel(fetch_pool, json_request, schedule_urls):
+            for play in schedule:
+                play_id = play.get('Play', {}).get('PlayId', None)
+                if play_id and play_id not in pool_sheets and play_id not in play_ids:
+                    play_ids.append(play_id)
+        pool_sheet_urls = [f'{base_url}/api/event/{event_id}/poolsheet/{play_id}' for play_id in play_ids]
+        for play_id, pool_sheet in zip(play_ids, map_parallel(fetch_pool, json_request, pool_sheet_urls)):
+            pool_sheets[play_id] = pool_sheet
+            covered.update(str(team.get('TeamId')) for team in pool_sheet.get('Pool', {}).get('Teams', []))
+        covered.update(batch)
+        pending = [team_id for team_id in pending if team_id not in covered]
+    return list(pool_sheets.values())
+
+
+# Builds the current schedules of every team in a nextassignments listing (a division's or a
+# club's teams). Divisions are loaded concurrently; pool sheets are indexed by team in one pass.
+def bulk_schedule_model(event_id, url):
+    model = {'event_id': event_id}
+    model.update(run_parallel(page_pool, {
+        'event_info':  (get_event_info, event_id),
+        'assignments': (json_request, url),
+    }))
+    teams = model.pop('assignments').get('value', [])
+
+    divisions = OrderedDict()
+    for team in teams:
+        division_id = (team.get('TeamDivision') or {}).get('DivisionId', '')
+        divisions.setdefault(division_id, []).append(team.get('TeamId', ''))
+    division_sheets = run_parallel(page_pool, {
+        division_id: (division_pool_sheets, event_id, division_id, team_ids) for division_id, team_ids in divisions.items()
+    })
+
+    build_start = time.perf_counter()
+    index = {}
+    for pool_sheets in division_sheets.values():
+        for pool_sheet in pool_sheets:
+            index_poolsheet(pool_sheet, index)
+    model['pool_count'] = sum(len(pool_sheets) for pool_sheets in division_sheets.values())
+    model['teams'] = []
+    for team in teams:
+        division = team.get('TeamDivision') or {}
+        team_id = team.get('TeamId', '')
+        model['teams'].append({
+            'team_id': team_id,
+            'name': team.get('TeamName', f'Team {team_id}'),
+            'club_name': (team.get('TeamClub') or {}).get('Name', ''),
+            'division': division.get('Name', ''),
+            'division_id': division.get('DivisionId', ''),
+            'current_schedule': indexed_team_matches(index, event_id, division.get('DivisionId', ''), team_id),
+        })
+    record_stage('model_build', build_start, schedule='bulk')
+    return model
+
+
+def bulk_schedule_page(key, model, title):
+    page_data = dict(model)
+    model['title'] = title
+    model['data_age'] = request_trace.get().data_age()
+    return conditional_response(key, page_data, lambda: render_timed("bulk_schedule.html", **model))
+
+
+@bp.route("/event/<event_id>/division/<division_id>")
+def division_schedule(event_id, division_id):
+    url = assignments_url(event_id, division_id=division_id)
+    model = bulk_schedule_model(event_id, url)
+    title = model['teams'][0]['division'] if model['teams'] else f'Division {division_id}'
+    return bulk_schedule_page(('division_schedule', event_id, division_id), model, title)
+
+
+@bp.route("/event/<event_id>/club/<club_id>")
+def club_schedule(event_id, club_id):
+    url = assignments_url(event_id, club_id=club_id)
+    model = bulk_schedule_model(event_id, url)
+    title = model['teams'][0]['club_name'] if model['teams'] else f'Club {club_id}'
+    return bulk_schedule_page(('club_schedule', event_id, club_id), model, title)
+
+
+# Per-event court timeline: every known pool match by court, in start time order, so "what's on
+# ICC 13 now and next" and "ICC 13 after 2pm" are answered with a binary search instead of by
+# loading and scanning the event's pool sheets. Pools are found the way the division schedules
+# find them (division_pool_sheets over the event-wide team listing) and are kept once seen, so
+# the morning's pools stay on the timeline after the round moves on. Updates are incremental: a
+# refresh reloads only the current round's unfinished pools (searching for new rounds every
+# court_discovery_interval), takes other pools from the memory cache without fetching them, and
+# only re-indexes the pool sheets whose cached response changed.
+court_timeline_max_events = 20
+# How often the pools of the teams' current rounds are searched for again, to find new rounds
+court_discovery_interval = 5 * 60
+# How many divisions a timeline's first build searches at a time on page_pool
+court_discovery_divisions_in_flight = 2
+
+# Courts sort by name with their numbers compared as numbers (ICC 2 before ICC 13)
+def court_sort_key(court):
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r'(\d+)', court)]
+
+
+class CourtTimeline(RefreshingIndex):
+    def __init__(self, event_id):
+        super().__init__()
+        self.event_id = event_id
+        self.courts_lock = threading.Lock()
+        self.pools = {}    # play id -> (pool sheet, division id, match ids, whether every match has scores)
+        self.current_pools = set()
+        self.discovered_at = 0
+        self.courts = {}   # court name -> [(start, match id)], sorted
+        self.matches = {}  # match id -> (court, start, end, match model)
+
+    def rebuild(self):
+        if self.state is None or time.time() - self.discovered_at >= court_discovery_interval:
+            sheets = self.discover()
+            self.current_pools = set(sheets)
+            self.discovered_at = time.time()
+        else:
+            # Between discoveries only the current round's unfinished pools are reloaded
+            pools = [(play_id, self.pools[play_id][1]) for play_id in self.current_pools
+                     if play_id in self.pools and not self.pools[play_id][3]]
+            urls = [self.pool_sheet_url(play_id) for play_id, _ in pools]
+            sheets = {play_id: (pool_sheet, division_id)
+                      for (play_id, division_id), pool_sheet in zip(pools, map_parallel(fetch_pool, json_request, urls))}
+        # Earlier rounds' pools and finished pools are taken as they are in the cache, never fetched
+        for play_id, (pool_sheet, division_id, _, _) in self.pools.items():
+            if play_id not in sheets:
+                entry = response_cache.peek(self.pool_sheet_url(play_id))
+                if entry is not None:
+                    sheets[play_id] = (entry.value, division_id)
+
+        with self.courts_lock:
+            for play_id, (pool_sheet, division_id) in sheets.items():
+                previous = self.pools.get(play_id)
+                if previous is None or previous[0] is not pool_sheet:
+                    self.update_pool(play_id, pool_sheet, division_id)
+        self.state = self.pools
+
+    # The current round's pool sheets of every division, by play id, with their division ids
+    def discover(self):
+        teams = json_request(assignments_url(self.event_id)).get('value', [])
+        divisions = OrderedDict()
+        for team in teams:
+            division_id = (team.get('TeamDivision') or {}).get('DivisionId', '')
+            divisions.setdefault(division_id, []).append(team.get('TeamId', ''))
+        if self.state is None:
+            # The first build is for a page view, so a few divisions are searched at a time
+            division_sheets = map_bounded(page_pool, lambda division: division_pool_sheets(self.event_id, *division),
+                                          list(divisions.items()), court_discovery_divisions_in_flight)
+        else:
+            # Refreshes already run on page_pool, so they search one division at a time
+            division_sheets = [division_pool_sheets(self.event_id, division_id, team_ids)
+                               for division_id, team_ids in divisions.items()]
+
+        sheets = {}
+        for division_id, pool_sheets in zip(divisions, division_sheets):
+            for pool_sheet in pool_sheets:
+                play_id = pool_sheet.get('Pool', {}).get('PlayId')
+                if play_id is not None:
+                    sheets[play_id] = (pool_sheet, division_id)
+        return sheets
+
+    def pool_sheet_url(self, play_id):
+        return f'{base_url}/api/event/{self.event_id}/poolsheet/{play_id}'
+
+    # Replaces a pool's matches on the timeline with those of its latest pool sheet. A match that
+    # has since moved to another pool is left to that pool.
+    def update_pool(self, play_id, pool_sheet, division_id):
+        previous = self.pools.get(play_id)
+        for match_id in previous[2] if previous else ():
+            entry = self.matches.get(match_id)
+            if entry is not None and entry[3].play_id == play_id:
+                self.remove_match(match_id)
+        play_info = pool_sheet.get('Pool', {})
+        match_ids = []
+        for match in pool_sheet.get('Matches', []):
+            match_id = match.get('MatchId')
+            court = (match.get('Court') or {}).get('Name')
+            if match_id is None or not court:
+                continue
+            self.remove_match(match_id)
+            start = match.get('ScheduledStartDateTime') or ''
+            record = match_summary(match, play_info, self.event_id, division_id)
+            self.matches[match_id] = (court, start, match.get('ScheduledEndDateTime') or start, record)
+            bisect.insort(self.courts.setdefault(court, []), (start, match_id))
+            match_ids.append(match_id)
+        matches = pool_sheet.get('Matches', [])
+        finished = bool(matches) and all(match.get('HasScores') for match in matches)
+        self.pools[play_id] = (pool_sheet, division_id, match_ids, finished)
+
+    def remove_match(self, match_id):
+        entry = self.matches.pop(match_id, None)
+        if entry is None:
+            return
+        court, start = entry[0], entry[1]
+        keys = self.courts[court]
+        del keys[bisect.bisect_left(keys, (start, match_id))]
+        if not keys:
+            del self.courts[court]
+
+    def court_names(self):
+        with self.courts_lock:
+            return sorted(self.courts, key=court_sort_key)
+
+    # The match models on court starting at or after after (an ISO timestamp; '' for all), in
+    # start time order
+    def court_matches(self, court, after='', limit=None):
+        with self.courts_lock:
+            keys = self.courts.get(court, [])
+            first = bisect.bisect_left(keys, (after,))
+            last = len(keys) if limit is None else first + limit
+            return [self.matches[match_id][3] for _, match_id in keys[first:last]]
+
+    # The match models (or None) being played on court at the ISO timestamp now, and starting
+    # next after it
+    def now_and_next(self, court, now):
+        with self.courts_lock:
+            keys = self.courts.get(court, [])
+            position = bisect.bisect_right(keys, (now, float('inf')))
+            current = following = None
+            if position > 0:
+                _, _, end, record = self.matches[keys[position - 1][1]]
+                if end >= now:
+                    current = record
+            if position < len(keys):
+                following = self.matches[keys[position][1]][3]
+            return current, following
+
+court_timelines = OrderedDict()
+court_timelines_lock = threading.Lock()
+
+def court_timeline(event_id):
+    with court_timelines_lock:
+        timeline = court_timelines.get(event_id)
+        if timeline is None:
+            timeline = court_timelines[event_id] = CourtTimeline(event_id)
+        court_timelines.move_to_end(event_id)
+        while len(court_timelines) > court_timeline_max_events:
+            court_timelines.popitem(last=False)
+    timeline.current()
+    return timeline
+
+
+# The time courts are looked at: ?at=<ISO timestamp>, default now (AES times are the venue's
+# local time, so a server in another time zone needs ?at). Times are returned in AES's format,
+# 2023-02-18T14:00:00. Raises ValueError if ?at is invalid.
+def court_time_arg():
+    at = request.args.get('at')
+    if not at:
+        return datetime.datetime.now().strftime('%Y-%m-%dT%H:%M:%S')
+    try:
+        return datetime.datetime.fromisoformat(at).strftime('%Y-%m-%dT%H:%M:%S')
+    except ValueError:
+        raise ValueError(f"Invalid at {at!r}, expected an ISO timestamp like 2023-02-18T14:00:00")
+
+
+# Every court of the event with the match on it now and the next one:
+#   { "event_id", "at", "courts": [ { "court", "now": match or null, "next": match or null } ] }
+def event_courts_model(event_id, at):
+    timeline = court_timeline(event_id)
+    courts = []
+    for court in timeline.court_names():
+        current, following = timeline.now_and_next(court, at)
+        courts.append({'court': court, 'now': current, 'next': following})
+    return {'event_id': event_id, 'at': at, 'courts': courts}
+
+
+# A court's matches starting at or after ?after=, either an ISO timestamp or a time of day
+# (14:00) on ?date= (YYYY-MM-DD, default today); all of its matches without ?after=. Raises
+# ValueError if ?after or ?date is invalid.
+def court_schedule_model(event_id, court):
+    after = request.args.get('after', '')
+    date = request.args.get('date')
+    try:
+        date = datetime.date.fromisoformat(date) if date else datetime.date.today()
+    except ValueError:
+        raise ValueError(f"Invalid date {date!r}, expected YYYY-MM-DD")
+    try:
+        if 'T' in after:
+            after = datetime.datetime.fromisoformat(after).strftime('%Y-%m-%dT%H:%M:%S')
+        elif after:
+            after = datetime.datetime.combine(date, datetime.time.fromisoformat(after)).strftime('%Y-%m-%dT%H:%M:%S')
+    except ValueError:
+        raise ValueError(f"Invalid after {after!r}, expected a time like 14:00 or an ISO timestamp")
+    return {'event_id': event_id, 'court': court, 'after': after,
+            'court_schedule': court_timeline(event_id).court_matches(court, after)}
+
+
+@bp.route("/event/<event_id>/courts")
+def event_courts(event_id):
+    try:
+        model = event_courts_model(event_id, court_time_arg())
+    except ValueError as err:
+        return jsonify({'error': str(err)}), 400
+    model['event_info'] = get_event_info(event_id)
+    model['data_age'] = request_trace.get().data_age()
+    return render_timed("event_courts.html", **model)
+
+
+@bp.route("/event/<event_id>/courts/<path:court>")
+def court_schedule(event_id, court):
+    try:
+        model = court_schedule_model(event_id, court)
+    except ValueError as err:
+        return jsonify({'error': str(err)}), 400
+    model['event_info'] = get_event_info(event_id)
+    page_data = dict(model)
+    model['data_age'] = request_trace.get().data_age()
+    return conditional_response(('court_schedule', event_id, court, model['after']), page_data,
+                                lambda: render_timed("court_schedule.html", **model))
+
+
+# Club dashboard: every club team's past, current and future schedules, streamed to the browser
+# as each team's schedules arrive instead of after the slowest team. Event info is fetched once
+# for the page and team info comes from the club listing; poolsheets shared by several of the
+# club's teams are fetched once through the cache and single-flight. Each team is one page_pool
+# task and only dashboard_teams_in_flight of a dashboard's teams load at a time, so a large
+# club's dashboard doesn't queue ahead of everyone else's pages.
+dashboard_teams_in_flight = 3
+
+schedule_whens = ('past', 'current', 'future')
+
+# A team's three schedules: the schedule responses are fetched together, then converted
+def club_team_schedule(event_id, division_id, team_id):
+    schedule_url = f'{base_url}/api/event/{event_id}/division/{division_id}/team/{team_id}/schedule'
+    map_parallel(fetch_pool, json_request, [f'{schedule_url}/{when}' for when in schedule_whens])
+    return {f'{when}_schedule': get_team_schedule(event_id, division_id, team_id, when) for when in schedule_whens}
+
+
+def club_team_schedules(event_id, teams):
+    models = [{
+        'team_id': team.get('TeamId', ''),
+        'name': team.get('TeamName', f"Team {team.get('TeamId', '')}"),
+        'division': (team.get('TeamDivision') or {}).get('Name', ''),
+        'division_id': (team.get('TeamDivision') or {}).get('DivisionId', ''),
+    } for team in teams]
+    queued = iter(range(len(models)))
+    futures = {}
+
+    def start_next():
+        position = next(queued, None)
+        if position is not None:
+            model = models[position]
+            futures[submit(page_pool, club_team_schedule, event_id, model['division_id'], model['team_id'])] = position
+
+    try:
+        for _ in range(dashboard_teams_in_flight):
+            start_next()
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                position = futures.pop(future)
+                models[position].update(future.result())
+                start_next()
+                yield models[position]
+    finally:
+        # The client went away before the page finished; drop the fetches not started yet
+        for future in futures:
+            future.cancel()
+
+
+@bp.route("/event/<event_id>/club/<club_id>/dashboard")
+def club_dashboard(event_id, club_id):
+    url = assignments_url(event_id, club_id=club_id)
+    model = run_parallel(page_pool, {
+        'event_info':  (get_event_info, event_id),
+        'assignments': (json_request, url),
+    })
+    teams = model.pop('assignments').get('value', [])
+    model['event_id'] = event_id
+    model['club_name'] = (teams[0].get('TeamClub') or {}).get('Name', '') if teams else f'Club {club_id}'
+    model['team_count'] = len(teams)
+    model['teams'] = club_team_schedules(event_id, teams)
+    # Evaluated at the end of the page, once every team's data has been fetched
+    model['data_age'] = request_trace.get().data_age
+    return Response(stream_template("club_dashboard.html", **model), mimetype='text/html',
+                    headers={'X-Accel-Buffering': 'no'})
+
+
+# JSON API (v1): the same models the HTML pages render. Match models in the schedules get a
+# 'key' (as used by the change feed), and ?fields=match_time,court returns only those fields of
+# each match. Responses are compact and carry an ETag, so unchanged data answers 304.
+schedule_sections = ('past_schedule', 'current_schedule', 'future_schedule', 'court_schedule')
+
+def api_model(data, fields=None):
+    if isinstance(data, list):
+        return [api_model(item, fields) for item in data]
+    if not isinstance(data, dict):
+        return data
+    result = {}
+    for name, value in data.items():
+        if name in schedule_sections:
+            result[name] = [dict({'key': match_key(match)},
+                                 **(match if fields is None else {field: match[field] for field in fields if field in match}))
+                            for match in value]
+        else:
+            result[name] = api_model(value, fields)
+    return result
+
+
+def api_response(key, model):
+    fields = request.args.get('fields')
+    model = api_model(model, fields.split(',') if fields else None)
+    model['data_age'] = request_trace.get().data_age()
+    page_data = dict(model, data_age=None)
+    return conditional_response(('api',) + key + (fields,), page_data,
+                                lambda: Response(json_dumps(model), mimetype='application/json'))
+
+
+@bp.route("/api/v1/events")
+def api_events():
+    model = event_list_model(**event_list_args())
+    return api_response(('events', model['start'], model['end'], model['q'], model['page'], model['per_page']), model)
+
+
+@bp.route("/api/v1/event/<event_id>")
+def api_event(event_id):
+    return api_response(('event', event_id), event_model(event_id))
+
+
+@bp.route("/api/v1/event/<event_id>/club/<club_id>")
+def api_club_teams(event_id, club_id):
+    return api_response(('club_teams', event_id, club_id), club_teams_model(event_id, club_id))
+
+
+@bp.route("/api/v1/event/<event_id>/club/<club_id>/schedule")
+def api_club_schedule(event_id, club_id):
+    url = assignments_url(event_id, club_id=club_id)
+    return api_response(('club_schedule', event_id, club_id), bulk_schedule_model(event_id, url))
+
+
+@bp.route("/api/v1/event/<event_id>/division/<division_id>")
+def api_division_schedule(event_id, division_id):
+    url = assignments_url(event_id, division_id=division_id)
+    return api_response(('division_schedule', event_id, division_id), bulk_schedule_model(event_id, url))
+
+
+@bp.route("/api/v1/event/<event_id>/courts")
+def api_event_courts(event_id):
+    try:
+        model = event_courts_model(event_id, court_time_arg())
+    except ValueError as err:
+        return jsonify({'error': str(err)}), 400
+    return api_response(('event_courts', event_id, model['at']), model)
+
+
+@bp.route("/api/v1/event/<event_id>/courts/<path:court>")
+def api_court_schedule(event_id, court):
+    try:
+        model = court_schedule_model(event_id, court)
+    except ValueError as err:
+        return jsonify({'error': str(err)}), 400
+    return api_response(('court_schedule', event_id, court, model['after']), model)
+
+
+@bp.route("/api/v1/event/<event_id>/division/<division_id>/team/<team_id>")
+def api_team(event_id, division_id, team_id):
+    model = team_page_model(event_id, division_id, team_id)
+    record_team_snapshot(event_id, division_id, team_id, model)
+    watch_team(event_id, division_id, team_id)
+    return api_response(('team', event_id, division_id, team_id), model)
+
+
+# Background poller: refreshes watched teams ahead of page views. Teams with a match starting
+# soon (or in progress) are polled every poll_interval_active seconds, others every
+# poll_interval_idle. All of the poller's upstream calls share poller_rate_limit, and a poolsheet
+# shared by several watched teams is only fetched once per interval because the poll only
+# requires data to be as fresh as the interval. Only one process polls at a time, chosen by a
+# lock file next to the cache database; the other keeps retrying in case the first exits.
+poller_enabled = True
+poll_interval_active = 30
+poll_interval_idle = 5 * 60
+# A match counts as active from this long before its start until this long after it
+poll_active_before = 30 * 60
+poll_active_after = 90 * 60
+poller_rate_limit = TokenBucket(rate=2, burst=10)
+
+poller_thread = None
+poller_lock = threading.Lock()
+poller_lock_file = None
+
+
+def watch_team(event_id, division_id, team_id, pinned=False):
+    if watch_list is None:
+        return
+    try:
+        watch_list.viewed(event_id, division_id, team_id, pinned)
+    except sqlite3.Error as err:
+        logger.error("Unable to watch %s/%s/%s: %s", event_id, division_id, team_id, err)
+
+
+# Returns True if a match in the team model starts soon or is in progress
+def team_has_active_match(model, now):
+    times = [match.get('match_time_raw') for match in model.get('current_schedule', [])]
+    times += [(match.get('next_match') or {}).get('ScheduledStartDateTime') for match in model.get('future_schedule', [])]
+    for match_time in times:
+        try:
+            start = datetime.datetime.strptime(match_time or '', "%Y-%m-%dT%H:%M:%S")
+        except ValueError:
+            continue
+        if -poll_active_before <= (now - start).total_seconds() <= poll_active_after:
+            return True
+    return False
+
+
+# Refreshes any of the team's data older than interval, and returns the interval to use for
+# its next poll
+def poll_team(event_id, division_id, team_id, interval):
+    policy = FetchPolicy(interval, rate_limiter=poller_rate_limit)
+    model = contextvars.copy_context().run(poll_with_policy, policy, event_id, division_id, team_id)
+    return poll_interval_active if team_has_active_match(model, datetime.datetime.now()) else poll_interval_idle
+
+
+def poll_with_policy(policy, event_id, division_id, team_id):
+    fetch_policy.set(policy)
+    request_trace.set(RequestTrace())
+    fetch_team_responses(event_id, division_id, team_id)
+    model = team_page_model(event_id, division_id, team_id)
+    record_team_snapshot(event_id, division_id, team_id, model)
+    return model
+
+
+# Takes the poller lock file without blocking; returns True if this process holds it
+def acquire_poller_lock():
+    global poller_lock_file
+    if poller_lock_file is not None:
+        return True
+    lock_file = open(f"{cache_db_path}.poller.lock", 'w')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    poller_lock_file = lock_file
+    logger.info("Process %s is running the background poller", os.getpid())
+    return True
+
+
+def poller_loop():
+    next_polls = {}
+    intervals = {}
+    while True:
+        try:
+            if not acquire_poller_lock():
+                time.sleep(60)
+                continue
+
+            for team in watch_teams:
+                watch_team(*team, pinned=True)
+            teams = [tuple(team) for team in watch_list.active()]
+            next_polls = {team: next_polls.get(team, 0) for team in teams}
+            intervals = {team: intervals.get(team, poll_interval_active) for team in teams}
+            for team in teams:
+                if next_polls[team] <= time.time():
+                    intervals[team] = poll_team(*team, intervals[team])
+                    next_polls[team] = time.time() + intervals[team]
+            wake = min(next_polls.values(), default=time.time() + poll_interval_active)
+            time.sleep(min(max(wake - time.time(), 1), poll_interval_active))
+        except Exception as err:
+            logger.error("Poller error: %s", err)
+            time.sleep(poll_interval_active)
+
+
+def start_poller():
+    global poller_thread
+    if poller_thread is not None or not poller_enabled or watch_list is None:
+        return
+    with poller_lock:
+        if poller_thread is None:
+            poller_thread = threading.Thread(target=poller_loop, name="vb_poller", daemon=True)
+            poller_thread.start()
+
+
+# Warm-up: preloads the caches of a cold process (after a restart or WSGIScriptReloading) so the
+# first visitors don't wait on AES: the event list and, for each event starting on the day, the
+# event, its team search index and the team listings of each of its divisions and clubs. It runs
+# in the background at process start, in one process at a time (chosen by a lock file next to the
+# cache database; the other process reads the same data from the shared disk cache), and from the
+# command line: python3 vb_results.py warmup [--date 2023-02-18]. Its fetches are made one at a
+# time from its own thread, so waiting on warmup_rate_limit never holds a fetch_pool worker.
+warmup_enabled = True
+warmup_rate_limit = TokenBucket(rate=5, burst=20)
+
+def warm_up(day=None):
+    day = day or datetime.date.today().isoformat()
+    start = time.perf_counter()
+    token = fetch_policy.set(FetchPolicy(float('inf'), max_stale_seconds, warmup_rate_limit))
+    try:
+        events = [event for event in event_index.current()['events'] if event['date'] == day]
+        for event in events:
+            event_id = event['event_id']
+            model = event_model(event_id)
+            urls = [assignments_url(event_id)]
+            urls += [assignments_url(event_id, division_id=division['division_id']) for division in model['divisions']]
+            urls += [assignments_url(event_id, club_id=club['club_id']) for club in model['clubs']]
+            for url in urls:
+                json_request(url)
+            # Built from the event and the event-wide listing, both cached by now
+            team_index(event_id)
+    finally:
+        fetch_policy.reset(token)
+    logger.info("Warmed up %d events starting %s in %.1fs", len(events), day, time.perf_counter() - start)
+    return events
+
+
+def start_warm_up():
+    if not warmup_enabled:
+        return
+
+    def run():
+        try:
+            with open(f"{cache_db_path}.warmup.lock", 'w') as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    logger.info("Another process is warming up the cache")
+                    return
+                warm_up()
+        except Exception as err:
+            logger.error("Warm-up failed: %s", err)
+    threading.Thread(target=run, name="vb_warmup", daemon=True).start()
+
+
+# Speculative prefetch: when a club's teams are listed, the info and schedules of each listed team
+# (up to prefetch_max_teams, at most prefetch_rate_limit upstream calls per second) are fetched in
+# the background, so the click through to a team page is served from the cache.
+prefetch_enabled = True
+prefetch_max_teams = 30
+prefetch_rate_limit = TokenBucket(rate=10, burst=30)
+prefetch_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="vb_prefetch")
+prefetch_pending = set()
+prefetch_pending_lock = threading.Lock()
+
+def prefetch_teams(event_id, teams):
+    if not prefetch_enabled:
+        return
+    for team in teams[:prefetch_max_teams]:
+        key = (event_id, team['division_id'], team['team_id'])
+        with prefetch_pending_lock:
+            if key in prefetch_pending:
+                continue
+            prefetch_pending.add(key)
+        # In a new context, so the prefetch isn't traced as part of the request that queued it
+        prefetch_pool.submit(contextvars.Context().run, prefetch_team, *key)
+
+
+def prefetch_team(event_id, division_id, team_id):
+    fetch_policy.set(FetchPolicy(float('inf'), max_stale_seconds, prefetch_rate_limit))
+    try:
+        fetch_team_responses(event_id, division_id, team_id)
+        # Convert the current schedule ahead of the page view, as its pool sheets are cached now
+        convert_schedule_current(event_id, division_id, team_id)
+    except Exception as err:
+        logger.error("Prefetch failed for %s/%s/%s: %s", event_id, division_id, team_id, err)
+    finally:
+        with prefetch_pending_lock:
+            prefetch_pending.discard((event_id, division_id, team_id))
+
+
+# Fetches the responses a team page is built from, one at a time on the calling thread: the team,
+# its schedules and its current round's pool sheets. For background callers with a rate limited
+# FetchPolicy, which would otherwise wait for the rate limit on page_pool and fetch_pool workers.
+def fetch_team_responses(event_id, division_id, team_id):
+    schedule_url = f'{base_url}/api/event/{event_id}/division/{division_id}/team/{team_id}/schedule'
+    for url in (f'{base_url}/api/event/{event_id}/teams/{team_id}', f'{base_url}/api/event/{event_id}',
+                f'{schedule_url}/past', f'{schedule_url}/future'):
+        json_request(url)
+    for play in json_request(f'{schedule_url}/current'):
+        play_id = play.get('Play', {}).get('PlayId', None)
+        if play_id:
+            json_request(f'{base_url}/api/event/{event_id}/poolsheet/{play_id}')
+
+
+def latest_change_token(event_id, division_id, team_id):
+    if change_log is None:
+        return 0
+    try:
+        return change_log.latest(f"{event_id}/{division_id}/{team_id}")
+    except sqlite3.Error as err:
+        logger.error("Unable to read changes for %s/%s/%s: %s", event_id, division_id, team_id, err)
+        return 0
+
+
+# Server-Sent Events stream of a team's match changes. Each open stream holds a WSGI thread, so
+# streams per process are capped and each one ends after stream_max_seconds; browsers reconnect
+# automatically and resume from the Last-Event-ID they were sent. Viewers turned away by the cap
+# (and browsers without EventSource) poll /changes every change_poll_interval seconds instead.
+stream_check_interval = 10
+stream_max_seconds = 30 * 60
+stream_max_connections = 5
+change_poll_interval = 30
+
+open_streams = 0
+open_streams_lock = threading.Lock()
+
+
+# One check loop per streamed team, shared by all of the team's open streams: while any stream
+# is open, the loop rebuilds the team's schedule every stream_check_interval seconds (from the
+# cache, which the poller keeps fresh), records it with the change log and wakes the streams to
+# send the new changes. The work grows with the number of streamed teams, not of viewers.
+class TeamFeed:
+    def __init__(self, event_id, division_id, team_id):
+        self.team = (event_id, division_id, team_id)
+        self.condition = threading.Condition()
+        self.version = 0
+        self.model = None
+        self.listeners = 0  # listeners and thread are guarded by team_feeds_lock
+        self.thread = None
+
+    # Waits up to timeout for a model newer than version; returns the latest (version, model)
+    def wait(self, version, timeout):
+        with self.condition:
+            self.condition.wait_for(lambda: self.version != version, timeout)
+            return self.version, self.model
+
+    def run(self):
+        while True:
+            with team_feeds_lock:
+                if self.listeners == 0:
+                    self.thread = None
+                    team_feeds.pop(self.team, None)
+                    return
+            try:
+                model = contextvars.Context().run(self.build)
+            except Exception as err:
+                logger.error("Team feed %s failed: %s", "/".join(self.team), err)
+            else:
+                with self.condition:
+                    self.model = model
+                    self.version += 1
+                    self.condition.notify_all()
+            time.sleep(stream_check_interval)
+
+    # Builds the team's model with a trace of its own, which record_team_snapshot checks
+    def build(self):
+        request_trace.set(RequestTrace())
+        model = team_page_model(*self.team)
+        record_team_snapshot(*self.team, model)
+        return model
+
+team_feeds = {}
+team_feeds_lock = threading.Lock()
+
+# Returns the team's feed, starting its check loop if this is its first listener
+def subscribe_team_feed(event_id, division_id, team_id):
+    team = (event_id, division_id, team_id)
+    with team_feeds_lock:
+        feed = team_feeds.get(team)
+        if feed is None:
+            feed = team_feeds[team] = TeamFeed(event_id, division_id, team_id)
+        feed.listeners += 1
+        if feed.thread is None:
+            feed.thread = threading.Thread(target=feed.run, name=f"vb_feed_{'/'.join(team)}", daemon=True)
+            feed.thread.start()
+    return feed
+
+# The feed's check loop stops after its last listener leaves
+def unsubscribe_team_feed(feed):
+    with team_feeds_lock:
+        feed.listeners -= 1
+
+
+@bp.route("/event/<event_id>/<division_id>/<team_id>/stream")
+def team_stream(event_id, division_id, team_id):
+    global open_streams
+    if change_log is None:
+        return jsonify({'error': 'Change detection is not available'}), 503
+    since = request.headers.get('Last-Event-ID', type=int)
+    if since is None:
+        since = request.args.get('since', type=int)
+    if since is None:
+        since = latest_change_token(event_id, division_id, team_id)
+
+    with open_streams_lock:
+        if open_streams >= stream_max_connections:
+            return jsonify({'error': 'Too many open streams'}), 503, {'Retry-After': str(stream_check_interval * 6)}
+        open_streams += 1
+    watch_team(event_id, division_id, team_id)
+    render_rows = get_template_attribute('macros.html', 'match_rows')
+    team_key = f"{event_id}/{division_id}/{team_id}"
+    feed = subscribe_team_feed(event_id, division_id, team_id)
+
+    def events(token):
+        global open_streams
+        try:
+            yield f"retry: {int(stream_check_interval * 1000)}\n\n"
+            deadline = time.time() + stream_max_seconds
+            version = 0
+            while time.time() < deadline:
+                version, model = feed.wait(version, stream_check_interval * 2)
+                changes = change_log.since(team_key, token) if model is not None else []
+                if changes:
+                    rows = {match_key(match): str(render_rows([match]))
+                            for section in ('past_schedule', 'current_schedule') for match in model.get(section, [])}
+                    for change in changes:
+                        change['row'] = rows.get(change['key'])
+                    token = changes[-1]['id']
+                    data = json.dumps({'token': token, 'changes': changes}, separators=(',', ':'))
+                    yield f"id: {token}\nevent: changes\ndata: {data}\n\n"
+                else:
+                    yield ": keepalive\n\n"
+        finally:
+            unsubscribe_team_feed(feed)
+            with open_streams_lock:
+                open_streams -= 1
+
+    return Response(stream_with_context(events(since)), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+# Where compiled templates are cached; None uses a per-user directory under the system temp dir
+template_cache_dir = None
+
+
+# Settings that can be set from the environment, as (module setting, environment variable, parser)
+def parse_bool(value):
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+def parse_teams(value):
+    return [tuple(team.split('/')) for team in value.split(',') if team.strip()]
+
+environment_settings = [
+    ('base_url', 'VB_AES_BASE_URL', str),
+    ('landing_url', 'VB_AES_LANDING_URL', str),
+    ('connect_timeout', 'VB_CONNECT_TIMEOUT', float),
+    ('read_timeout', 'VB_READ_TIMEOUT', float),
+    ('max_retries', 'VB_MAX_RETRIES', int),
+    ('retry_backoff', 'VB_RETRY_BACKOFF', float),
+    ('pool_maxsize', 'VB_POOL_MAXSIZE', int),
+    ('upstream_rate_limit', 'VB_UPSTREAM_RATE_LIMIT', float),
+    ('upstream_rate_burst', 'VB_UPSTREAM_RATE_BURST', int),
+    ('upstream_rate_wait', 'VB_UPSTREAM_RATE_WAIT', float),
+    ('breaker_failure_threshold', 'VB_BREAKER_FAILURE_THRESHOLD', int),
+    ('breaker_open_seconds', 'VB_BREAKER_OPEN_SECONDS', float),
+    ('cache_max_entries', 'VB_CACHE_MAX_ENTRIES', int),
+    ('max_stale_seconds', 'VB_MAX_STALE_SECONDS', int),
+    ('cache_db_path', 'VB_CACHE_DB_PATH', str),
+    ('cache_db_max_bytes', 'VB_CACHE_DB_MAX_BYTES', int),
+    ('poller_enabled', 'VB_POLLER_ENABLED', parse_bool),
+    ('warmup_enabled', 'VB_WARMUP_ENABLED', parse_bool),
+    ('prefetch_enabled', 'VB_PREFETCH_ENABLED', parse_bool),
+    ('poll_interval_active', 'VB_POLL_INTERVAL_ACTIVE', int),
+    ('poll_interval_idle', 'VB_POLL_INTERVAL_IDLE', int),
+    ('watch_teams', 'VB_WATCH_TEAMS', parse_teams),
+    ('watch_expiry_seconds', 'VB_WATCH_EXPIRY_SECONDS', int),
+    ('stream_max_connections', 'VB_STREAM_MAX_CONNECTIONS', int),
+    ('server_timing_enabled', 'VB_SERVER_TIMING', parse_bool),
+    ('template_cache_dir', 'VB_TEMPLATE_CACHE_DIR', str),
+    ('log_level', 'VB_LOG_LEVEL', str),
+]
+
+# Profiles for create_app. Production runs without the interactive debugger and logs warnings
+# and errors only; development enables Flask debug mode, the werkzeug debugger and debug logging.
+config_profiles = {
+    'production': {'debug': False, 'log_level': 'WARNING'},
+    'development': {'debug': True, 'log_level': 'DEBUG'},
+}
+
+
+def settings_from_environment():
+    settings = {}
+    for name, variable, parse in environment_settings:
+        if os.environ.get(variable):
+            settings[name] = parse(os.environ[variable])
+    # VB_CACHE_TTL_<FAMILY>, e.g. VB_CACHE_TTL_POOLSHEET=30
+    for family in cache_ttls:
+        variable = f'VB_CACHE_TTL_{family.upper()}'
+        if os.environ.get(variable):
+            settings.setdefault('cache_ttls', {})[family] = int(os.environ[variable])
+    return settings
+
+
+# Applies settings (a profile's, then the environment's, then the given overrides) to the module
+# and (re)creates the HTTP session and the cache stores they configure
+def configure(profile='production', **overrides):
+    global http_session, disk_cache, change_log, watch_list
+    settings = dict(config_profiles[profile])
+    settings.update(settings_from_environment())
+    settings.update(overrides)
+
+    for name, value in settings.items():
+        if name == 'cache_ttls':
+            cache_ttls.update(value)
+        elif name not in ('debug', 'log_level'):
+            globals()[name] = value
+    logger.setLevel(settings['log_level'].upper())
+
+    http_session = create_session()
+    with upstream_guards_lock:
+        upstream_guards.clear()
+    response_cache.max_entries = cache_max_entries
+    disk_cache = open_disk_cache()
+    change_log = open_change_log()
+    watch_list = open_watch_list()
+    return settings
+
+
+# Creates the Flask app. config is a profile name ('production' or 'development', defaulting to
+# $VB_PROFILE or production) or a dict with an optional 'profile' and settings overriding it.
+def create_app(config=None):
+    if config is None or isinstance(config, str):
+        config = {'profile': config or os.environ.get('VB_PROFILE', 'production')}
+    config = dict(config)
+    settings = configure(config.pop('profile', 'production'), **config)
+
+    app = Flask(__name__)
+    app.register_blueprint(bp)
+    # Compiled templates are cached on disk, so new processes skip compiling them, and every
+    # template is loaded now rather than on the first request that uses it
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(template_cache_dir)
+    for template in app.jinja_env.list_templates():
+        app.jinja_env.get_template(template)
+    if not logger.handlers:
+        logger.addHandler(default_handler)
+    if settings['debug']:
+        app.debug = True
+        app.wsgi_app = DebuggedApplication(app.wsgi_app, evalex=True)
+    start_poller()
+    start_warm_up()
+    return app
+
+
+def cache_command(args):
+    if disk_cache is None:
+        print(f"Disk cache is not available ({cache_db_path})", file=sys.stderr)
+        return 1
+
+    if args.action == 'stats':
+        for key, value in disk_cache.stats().items():
+            print(f"{key}: {value}")
+    elif args.action == 'list':
+        now = time.time()
+        for url, family, fetched_at, size in disk_cache.entries(args.family, args.limit):
+            print(f"{now - fetched_at:8.0f}s {size:9d}B {family:<16} {url}")
+    elif args.action == 'purge':
+        if not (args.all or args.family or args.url_prefix or args.older_than is not None):
+            print("Refusing to purge everything without --all", file=sys.stderr)
+            return 1
+        purged = disk_cache.purge(args.family, args.url_prefix, args.older_than)
+        print(f"Purged {purged} entries")
+    return 0
+
+
+def warmup_command(args):
+    for event in warm_up(args.date):
+        print(f"{event['event_id']} {event['name']}")
+    return 0
 
-    model['past_schedule'] = get_team_schedule(event_id, division_id, team_id, 'past')
 
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="vb_results utilities")
+    commands = parser.add_subparsers(dest='command', required=True)
 
-    model['current_schedule'] = get_team_schedule(event_id, division_id, team_id, 'current')
+    cache_parser = commands.add_parser('cache', help="Inspect or purge the shared disk cache")
+    cache_parser.add_argument('action', choices=['stats', 'list', 'purge'])
+    cache_parser.add_argument('--family', help="Only entries for this endpoint family (e.g. poolsheet)")
+    cache_parser.add_argument('--url-prefix', help="purge: only urls starting with this prefix")
+    cache_parser.add_argument('--older-than', type=float, help="purge: only entries fetched more than this many seconds ago")
+    cache_parser.add_argument('--all', action='store_true', help="purge: allow purging every entry")
+    cache_parser.add_argument('--limit', type=int, default=100, help="list: maximum entries to show")
+    cache_parser.set_defaults(func=cache_command)
 
-    model['future_schedule'] = get_team_schedule(event_id, division_id, team_id, 'future')
+    warmup_parser = commands.add_parser('warmup', help="Preload the shared cache with today's events")
+    warmup_parser.add_argument('--date', help="Events starting on this date (YYYY-MM-DD) instead of today")
+    warmup_parser.set_defaults(func=warmup_command)
 
-    return render_template(f"team_page_{format}.html", **model)
+    args = parser.parse_args()
+    configure(os.environ.get('VB_PROFILE', 'production'), poller_enabled=False)
+    sys.exit(args.func(args))